@@ -4,11 +4,14 @@ Dolphin PDF Processing API
 Main application file that initializes and configures the FastAPI application.
 """
 
+import asyncio
 import logging
-from contextlib import asynccontextmanager
+import logging.config
+from contextlib import AsyncExitStack, asynccontextmanager
+from functools import partial
 
 from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response
 
 from .config import settings
 from .controllers import health_controller, processing_controller, task_controller
@@ -18,82 +21,183 @@ from .processors import DolphinProcessor
 from .services import PDFProcessingService
 
 # Configure logging
-logging.basicConfig(
-    level=getattr(logging, settings.LOG_LEVEL),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Chatty library loggers stay at WARNING even when the app runs at DEBUG
+logging.config.dictConfig({
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "default": {
+            "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+        }
+    },
+    "handlers": {
+        "default": {
+            "class": "logging.StreamHandler",
+            "formatter": "default"
+        }
+    },
+    "loggers": {
+        "azure": {"level": "WARNING"},
+        "azure.core.pipeline.policies.http_logging_policy": {"level": "WARNING"},
+        "uvicorn.access": {"level": "WARNING"}
+    },
+    "root": {"level": settings.LOG_LEVEL, "handlers": ["default"]}
+})
 logger = logging.getLogger(__name__)
 
-# Global instances
-processing_service = None
-task_manager = None
-blob_manager = None
+
+def merged_lifespan(*lifespans):
+    """Compose several lifespan context managers into one
+    
+    Lifespans are entered in order and exited in reverse order.
+    """
+    @asynccontextmanager
+    async def _lifespan(app: FastAPI):
+        async with AsyncExitStack() as stack:
+            for lifespan_factory in lifespans:
+                await stack.enter_async_context(lifespan_factory(app))
+            yield
+    
+    return _lifespan
+
+
+def _load_processor(model_path: str) -> DolphinProcessor:
+    """Load the Dolphin model and warm it up before it serves requests"""
+    processor = DolphinProcessor(model_path)
+    processor.warmup()
+    return processor
 
 
 @asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Application lifespan manager"""
-    global processing_service, task_manager, blob_manager
+async def model_lifespan(app: FastAPI):
+    """Load the Dolphin model in the background so startup is not blocked"""
+    logger.info("Initializing Dolphin processor from %s in the background...", settings.MODEL_PATH)
+    processor_task = asyncio.create_task(
+        asyncio.to_thread(_load_processor, settings.MODEL_PATH)
+    )
+    app.state.processor_task = processor_task
+    try:
+        yield
+    finally:
+        if not processor_task.done():
+            processor_task.cancel()
+
+
+def _attach_processor(processing_service: PDFProcessingService, task: asyncio.Task):
+    """Hand the loaded model to the processing service once warmup finishes"""
+    if task.cancelled():
+        return
+    
+    error = task.exception()
+    if error is not None:
+        logger.error("Failed to load Dolphin model: %s", error)
+        processing_service.set_model_load_error(error)
+    else:
+        processing_service.set_processor(task.result())
+        logger.info("Dolphin model loaded and ready")
+
+
+@asynccontextmanager
+async def services_lifespan(app: FastAPI):
+    """Initialize storage, task management and the processing service"""
+    task_manager = None
+    blob_manager = None
+    file_manager = None
     
     try:
-        # Initialize Dolphin processor
-        logger.info(f"Initializing Dolphin processor from {settings.MODEL_PATH}...")
-        processor = DolphinProcessor(settings.MODEL_PATH)
-        
-        # Initialize blob storage manager if configured
+        # Initialize blob storage manager if configured (overlaps with model load)
+        blob_task = None
         if settings.is_blob_storage_configured:
             logger.info("Initializing blob storage manager...")
-            blob_manager = BlobStorageManager(settings.AZURE_STORAGE_CONNECTION_STRING)
+            blob_task = asyncio.create_task(
+                asyncio.to_thread(BlobStorageManager, settings.AZURE_STORAGE_CONNECTION_STRING)
+            )
         else:
             logger.warning("AZURE_STORAGE_CONNECTION_STRING not set. Blob storage features will be disabled.")
         
-        # Initialize file manager
-        file_manager = FileManager()
+        # Initialize file manager (resolving the temp dir probes the filesystem)
+        file_manager = await asyncio.to_thread(FileManager)
         
         # Initialize task manager with thread pool
-        logger.info(f"Initializing background task manager with {settings.MAX_WORKERS} worker(s)...")
-        task_manager = BackgroundTaskManager(max_workers=settings.MAX_WORKERS)
+        logger.info(
+            "Initializing background task manager with %d GPU worker(s) and %d CPU worker(s)...",
+            settings.MAX_WORKERS,
+            settings.CPU_WORKERS
+        )
+        task_manager = BackgroundTaskManager(
+            gpu_workers=settings.MAX_WORKERS,
+            cpu_workers=settings.CPU_WORKERS,
+            inference_processes=settings.INFERENCE_PROCESSES,
+            model_path=settings.MODEL_PATH
+        )
         
-        # Initialize processing service
+        # Start background worker
+        logger.info("Starting background worker...")
+        await task_manager.start_worker()
+        
+        if blob_task:
+            blob_manager = await blob_task
+            try:
+                await blob_manager.ensure_containers(
+                    settings.CONTAINER_NAME, settings.DEFAULT_OUTPUT_CONTAINER
+                )
+            except Exception as e:
+                # Not fatal: containers are ensured again on first upload
+                logger.warning("Could not pre-create blob containers: %s", e)
+        
+        # Initialize processing service; the model is attached once loaded
         processing_service = PDFProcessingService(
-            processor=processor,
+            processor=None,
             blob_manager=blob_manager,
             file_manager=file_manager,
-            task_manager=task_manager
+            task_manager=task_manager,
+            max_concurrent_inference=settings.MAX_WORKERS
+        )
+        app.state.processor_task.add_done_callback(
+            partial(_attach_processor, processing_service)
         )
         
-        # Set service references in controllers
-        health_controller.set_processing_service(processing_service)
-        processing_controller.set_services(processing_service, blob_manager)
-        task_controller.set_task_manager(task_manager)
+        # Expose services to controllers through dependencies
+        app.state.processing_service = processing_service
+        app.state.blob_manager = blob_manager
+        app.state.task_manager = task_manager
         
-        # Start background worker
-        logger.info("Starting background worker...")
-        await task_manager.start_worker()
-        
-        logger.info(f"Dolphin API started successfully on {settings.API_HOST}:{settings.API_PORT}")
-        logger.info(f"Model: {settings.MODEL_PATH}")
-        logger.info(f"Blob Storage: {'Configured' if settings.is_blob_storage_configured else 'Not Configured'}")
+        logger.info("Dolphin API started successfully on %s:%s", settings.API_HOST, settings.API_PORT)
+        logger.info("Model: %s", settings.MODEL_PATH)
+        logger.info(
+            "Blob Storage: %s",
+            "Configured" if settings.is_blob_storage_configured else "Not Configured"
+        )
         
         yield
         
     except Exception as e:
-        logger.error(f"Failed to initialize API: {str(e)}")
+        logger.error("Failed to initialize API: %s", e)
         raise
     finally:
         # Stop background worker
         if task_manager:
             logger.info("Stopping background worker...")
             await task_manager.stop_worker()
+        # Release pooled blob storage connections
+        if blob_manager:
+            await blob_manager.close()
+        # Remove idle pooled temp files
+        if file_manager:
+            file_manager.close()
         logger.info("Shutting down Dolphin API")
 
 
+lifespan = merged_lifespan(model_lifespan, services_lifespan)
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title=settings.API_TITLE,
     description=settings.API_DESCRIPTION,
     version=settings.API_VERSION,
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 
@@ -101,13 +205,14 @@ app = FastAPI(
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """Global exception handler"""
-    logger.error(f"Unhandled exception: {str(exc)}", exc_info=True)
-    return JSONResponse(
-        status_code=500,
+    logger.error("Unhandled exception: %s", exc, exc_info=True)
+    return Response(
         content=ErrorResponse(
             error="Internal server error",
-            detail=str(exc)
-        ).dict()
+            detail=PDFProcessingService.failure_detail(exc, "Internal server error")
+        ).model_dump_json().encode(),
+        status_code=500,
+        media_type="application/json"
     )
 
 
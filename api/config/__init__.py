@@ -2,8 +2,8 @@
 Configuration module for the Dolphin PDF Processing API
 """
 
-from .settings import settings
+from .settings import Settings, get_settings, settings
 
-__all__ = ["settings"]
+__all__ = ["Settings", "get_settings", "settings"]
 
 
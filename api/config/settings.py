@@ -5,45 +5,60 @@ Centralized configuration management using environment variables.
 """
 
 import os
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
-from dotenv import load_dotenv
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 # Load environment variables from .env file if it exists
 env_path = Path(__file__).parent.parent.parent / '.env'
-if env_path.exists():
-    load_dotenv(env_path)
 
 
-class Settings:
-    """Application settings loaded from environment variables"""
+class Settings(BaseSettings):
+    """Application settings loaded from environment variables
+    
+    Values are validated once on construction and the instance is frozen.
+    """
+    
+    model_config = SettingsConfigDict(
+        env_file=env_path,
+        env_file_encoding="utf-8",
+        extra="ignore",
+        frozen=True
+    )
     
     # Azure Storage Configuration
-    AZURE_STORAGE_CONNECTION_STRING: Optional[str] = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+    AZURE_STORAGE_CONNECTION_STRING: Optional[str] = None
     
     # Model Configuration
-    MODEL_PATH: str = os.getenv("MODEL_PATH", "./Dolphin/hf_model")
-    MAX_BATCH_SIZE: int = int(os.getenv("MAX_BATCH_SIZE", "16"))
+    MODEL_PATH: str = "./Dolphin/hf_model"
+    MAX_BATCH_SIZE: int = 16
     
     # Container Configuration
-    CONTAINER_NAME: str = os.getenv("CONTAINER_NAME", "dolphin-processing")
-    DEFAULT_OUTPUT_CONTAINER: str = os.getenv("DEFAULT_OUTPUT_CONTAINER", "dolphin-results")
+    CONTAINER_NAME: str = "dolphin-processing"
+    DEFAULT_OUTPUT_CONTAINER: str = "dolphin-results"
     
     # API Configuration
-    API_HOST: str = os.getenv("API_HOST", "0.0.0.0")
-    API_PORT: int = int(os.getenv("API_PORT", "8000"))
+    API_HOST: str = "0.0.0.0"
+    API_PORT: int = 8000
     API_VERSION: str = "1.0.0"
     API_TITLE: str = "Dolphin PDF Processing API"
     API_DESCRIPTION: str = "API for processing PDFs using Dolphin document parsing model"
     
     # Background Processing Configuration
-    MAX_WORKERS: int = int(os.getenv("MAX_WORKERS", "1"))
+    MAX_WORKERS: int = 1
     # Number of concurrent PDF processing workers
     # Set to 1 to avoid GPU memory issues. Increase only if you have multiple GPUs.
+    CPU_WORKERS: int = Field(default_factory=lambda: max(1, (os.cpu_count() or 4) // 4))
+    # Number of PDF rasterization workers; CPU work overlaps GPU inference per task
+    INFERENCE_PROCESSES: bool = False
+    # Run inference in worker processes (one model per process) instead of threads.
+    # Intended for CPU inference with MAX_WORKERS > 1; keep False on a single GPU.
     
     # Logging Configuration
-    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_LEVEL: str = "INFO"
     
     @property
     def is_blob_storage_configured(self) -> bool:
@@ -61,6 +76,15 @@ class Settings:
         )
 
 
-# Global settings instance
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Get the process-wide settings instance
+    
+    Returns:
+        Cached Settings instance
+    """
+    return Settings()
+
 
+# Global settings instance
+settings = get_settings()
@@ -0,0 +1,43 @@
+"""
+Controller Dependencies
+
+FastAPI dependency providers that resolve services stored on app.state.
+"""
+
+from fastapi import HTTPException, Request, status
+
+from ..managers import BackgroundTaskManager, BlobStorageManager
+from ..services import PDFProcessingService
+
+
+def get_processing_service(request: Request) -> PDFProcessingService:
+    """Resolve the processing service, or raise 503 before startup completes"""
+    service = getattr(request.app.state, "processing_service", None)
+    if service is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Service not initialized"
+        )
+    return service
+
+
+def get_blob_manager(request: Request) -> BlobStorageManager:
+    """Resolve the blob storage manager, or raise 503 if not configured"""
+    blob_manager = getattr(request.app.state, "blob_manager", None)
+    if blob_manager is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Blob storage not configured"
+        )
+    return blob_manager
+
+
+def get_task_manager(request: Request) -> BackgroundTaskManager:
+    """Resolve the background task manager, or raise 503 before startup completes"""
+    task_manager = getattr(request.app.state, "task_manager", None)
+    if task_manager is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Task manager not initialized"
+        )
+    return task_manager
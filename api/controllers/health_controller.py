@@ -6,24 +6,17 @@ Handles health check and service information endpoints.
 
 import logging
 
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status
 
-from ..config import settings
+from ..config import get_settings
 from ..models import HealthResponse
+from ..services import PDFProcessingService
+from .dependencies import get_processing_service
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["Health"])
 
-# Global service reference (will be set by main.py)
-_processing_service = None
-
-
-def set_processing_service(service):
-    """Set the processing service instance"""
-    global _processing_service
-    _processing_service = service
-
 
 @router.get("/", response_model=dict)
 async def root():
@@ -31,39 +24,37 @@ async def root():
     return {
         "message": "Dolphin PDF Processing API is running",
         "status": "healthy",
-        "version": settings.API_VERSION
+        "version": get_settings().API_VERSION
     }
 
 
-@router.get("/health", response_model=HealthResponse)
-async def health_check():
+@router.get("/health", response_model=None, responses={200: {"model": HealthResponse}})
+async def health_check(
+    processing_service: PDFProcessingService = Depends(get_processing_service)
+):
     """Detailed health check endpoint"""
-    if not _processing_service:
+    if processing_service.model_load_error:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Service not initialized"
+            detail="Model failed to load"
         )
     
-    service_info = _processing_service.get_service_info()
+    service_info = processing_service.get_service_info()
+    processor_info = service_info["processor_info"]
     
+    # Report degraded (but reachable) while the model is still warming up
     return HealthResponse(
-        status="healthy",
-        model_loaded=_processing_service.processor is not None,
+        status="healthy" if processor_info else "starting",
+        model_loaded=processor_info is not None,
         blob_storage_available=service_info["blob_storage_available"],
-        device=service_info["processor_info"]["device"],
-        version=settings.API_VERSION
-    )
+        device=processor_info["device"] if processor_info else "unknown",
+        version=get_settings().API_VERSION
+    ).model_dump()
 
 
 @router.get("/service-info", response_model=dict)
-async def get_service_info():
+async def get_service_info(
+    processing_service: PDFProcessingService = Depends(get_processing_service)
+):
     """Get detailed service information"""
-    if not _processing_service:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Service not initialized"
-        )
-    
-    return _processing_service.get_service_info()
-
-
+    return processing_service.get_service_info()
@@ -6,29 +6,25 @@ Handles PDF processing endpoints.
 
 import logging
 
-from fastapi import APIRouter, HTTPException, UploadFile, status
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, status
 
-from ..config import settings
+from ..config import get_settings
+from ..managers import BlobStorageManager
 from ..models import ProcessingRequest, ProcessingResponse
+from ..services import PDFProcessingService
+from .dependencies import get_blob_manager, get_processing_service
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/process", tags=["Processing"])
 
-# Global service references (will be set by main.py)
-_processing_service = None
-_blob_manager = None
-
-
-def set_services(processing_service, blob_manager):
-    """Set the service instances"""
-    global _processing_service, _blob_manager
-    _processing_service = processing_service
-    _blob_manager = blob_manager
-
 
 @router.post("/pdf", response_model=ProcessingResponse)
-async def process_pdf(request: ProcessingRequest, async_mode: bool = True):
+async def process_pdf(
+    request: ProcessingRequest,
+    async_mode: bool = True,
+    processing_service: PDFProcessingService = Depends(get_processing_service)
+):
     """Process a PDF file from blob storage
     
     Args:
@@ -38,26 +34,20 @@ async def process_pdf(request: ProcessingRequest, async_mode: bool = True):
     Returns:
         ProcessingResponse with task ID and status
     """
-    if not _processing_service:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Service not initialized"
-        )
-    
     try:
-        return await _processing_service.process_pdf_from_blob(
+        return await processing_service.process_pdf_from_blob(
             pdf_url=request.pdf_url,
             output_container=request.output_container,
-            max_batch_size=request.max_batch_size or settings.MAX_BATCH_SIZE,
+            max_batch_size=request.max_batch_size or get_settings().MAX_BATCH_SIZE,
             async_processing=async_mode
         )
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error in process_pdf endpoint: {str(e)}")
+        logger.exception("Error in process_pdf endpoint")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to process PDF: {str(e)}"
+            detail=PDFProcessingService.failure_detail(e)
         )
 
 
@@ -66,7 +56,8 @@ async def process_pdf_upload(
     file: UploadFile,
     output_container: str = "dolphin-results",
     max_batch_size: int = 16,
-    async_mode: bool = True
+    async_mode: bool = True,
+    processing_service: PDFProcessingService = Depends(get_processing_service)
 ):
     """Process an uploaded PDF file
     
@@ -79,14 +70,8 @@ async def process_pdf_upload(
     Returns:
         ProcessingResponse with task ID and status
     """
-    if not _processing_service:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Service not initialized"
-        )
-    
     try:
-        return await _processing_service.process_pdf_upload(
+        return await processing_service.process_pdf_upload(
             file=file,
             output_container=output_container,
             max_batch_size=max_batch_size,
@@ -95,10 +80,10 @@ async def process_pdf_upload(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error in process_pdf_upload endpoint: {str(e)}")
+        logger.exception("Error in process_pdf_upload endpoint")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to process PDF: {str(e)}"
+            detail=PDFProcessingService.failure_detail(e)
         )
 
 
@@ -106,7 +91,9 @@ async def process_pdf_upload(
 async def upload_pdf_to_blob(
     file: UploadFile,
     container_name: str = "pdf-uploads",
-    blob_name: str = None
+    blob_name: str = None,
+    processing_service: PDFProcessingService = Depends(get_processing_service),
+    blob_manager: BlobStorageManager = Depends(get_blob_manager)
 ):
     """Upload a PDF file to Azure Blob Storage without processing
     
@@ -118,18 +105,6 @@ async def upload_pdf_to_blob(
     Returns:
         Dictionary with upload information including blob URL
     """
-    if not _processing_service:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Service not initialized"
-        )
-    
-    if not _blob_manager:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Blob storage not configured"
-        )
-    
     try:
         # Validate PDF file
         if not file.filename.endswith('.pdf'):
@@ -142,45 +117,40 @@ async def upload_pdf_to_blob(
         if blob_name is None:
             blob_name = file.filename
         
-        logger.info(f"Uploading PDF {file.filename} to blob storage")
+        logger.info("Uploading PDF %s to blob storage", file.filename)
         
-        # Read file content
-        file_content = await file.read()
-        
-        # Save to temporary file
-        temp_file = _processing_service.file_manager.save_upload_to_temp(
-            file_content, file.filename
-        )
+        # Stream file content to a temporary file
+        temp_file, file_size = await processing_service.file_manager.stream_upload_to_temp(file)
         
         try:
             # Upload to blob storage
-            blob_url = await _blob_manager.upload_file_to_blob(
+            blob_url = await blob_manager.upload_file_to_blob(
                 temp_file, container_name, blob_name
             )
             
-            logger.info(f"Successfully uploaded PDF to {blob_url}")
+            logger.info("Successfully uploaded PDF to %s", blob_url)
             
             return {
                 "status": "success",
-                "message": f"PDF uploaded successfully",
+                "message": "PDF uploaded successfully",
                 "blob_url": blob_url,
                 "container": container_name,
                 "blob_name": blob_name,
                 "original_filename": file.filename,
-                "file_size": len(file_content)
+                "file_size": file_size
             }
             
         finally:
             # Clean up temporary file
-            _processing_service.file_manager.cleanup_temp_file(temp_file)
+            processing_service.file_manager.cleanup_temp_file(temp_file)
     
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error uploading PDF: {str(e)}")
+        logger.exception("Error uploading PDF")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to upload PDF: {str(e)}"
+            detail=PDFProcessingService.failure_detail(e, "Failed to upload PDF")
         )
 
 
@@ -4,16 +4,50 @@ Azure Blob Storage Manager
 Handles blob storage operations for downloading PDFs and uploading results.
 """
 
-import json
+import asyncio
 import logging
+import os
+import re
 import tempfile
-from typing import Dict, Optional
-from urllib.parse import urlparse
+from typing import Dict, List, Optional, Set
 
+import aiofiles
+import orjson
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.storage.blob import ContentSettings
 from azure.storage.blob.aio import BlobServiceClient
 
+from ..config import settings
+from .uring_writer import URING_SUPPORTED, UringWriter
+
 logger = logging.getLogger(__name__)
 
+# Matches https://<account>.blob.core.windows.net/<container>/<blob>
+_BLOB_URL_RE = re.compile(r"https?://[^/]+/([^/]+)/([^?#]+)")
+
+# Blobs up to this size are fetched by the SDK's initial GET in one response
+SINGLE_GET_SIZE = 64 * 1024 * 1024
+
+# Size of each ranged GET the SDK issues beyond the initial one
+MAX_CHUNK_GET_SIZE = 8 * 1024 * 1024
+
+# Submit each downloaded chunk to io_uring as it arrives, holding at most
+# this many bytes in writes the disk has not finished yet
+URING_DOWNLOAD_MAX_PENDING = 4 * MAX_CHUNK_GET_SIZE
+
+# Shared by every JSON upload so readers get the right Content-Type
+JSON_CONTENT_SETTINGS = ContentSettings(content_type="application/json")
+
+
+def _pwrite_all(fd: int, data: bytes, offset: int) -> None:
+    """Write all of data at offset, retrying after short writes"""
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
 
 class BlobStorageManager:
     """Manages Azure blob storage operations"""
@@ -25,7 +59,81 @@ class BlobStorageManager:
             connection_string: Azure Storage connection string
         """
         self.connection_string = connection_string
-        self.blob_service_client = BlobServiceClient.from_connection_string(connection_string)
+        # A single long-lived service client; per-blob clients created from it
+        # share its transport, so connections are pooled across operations.
+        self.blob_service_client = BlobServiceClient.from_connection_string(
+            connection_string,
+            max_single_get_size=SINGLE_GET_SIZE,
+            max_chunk_get_size=MAX_CHUNK_GET_SIZE,
+            connection_timeout=30
+        )
+        self._account_name = self.blob_service_client.account_name
+        self._url_prefix = f"https://{self._account_name}.blob.core.windows.net/"
+        self._ensured_containers: Set[str] = set()
+        self._ensure_lock: Optional[asyncio.Lock] = None
+        # Compact output by default; pretty-print only when debugging
+        self._json_options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if settings.LOG_LEVEL == "DEBUG":
+            self._json_options |= orjson.OPT_INDENT_2
+        self._use_uring = URING_SUPPORTED
+    
+    def _open_temp_writer(self, fd: int):
+        """Wrap a temp file descriptor in an async writer, preferring io_uring when available
+        
+        Args:
+            fd: Writable file descriptor; ownership passes to the returned writer
+        """
+        if self._use_uring:
+            try:
+                return UringWriter(fd, queue_depth=1, max_pending_bytes=URING_DOWNLOAD_MAX_PENDING)
+            except Exception as e:
+                logger.warning("io_uring unavailable, falling back to aiofiles: %s", e)
+                self._use_uring = False
+        return aiofiles.open(fd, 'wb')
+    
+    async def close(self):
+        """Close the underlying service client and its connection pool"""
+        await self.blob_service_client.close()
+    
+    async def _ensure_container(self, container_name: str):
+        """Create the container once per process, skipping the roundtrip afterwards
+        
+        Args:
+            container_name: Container name to ensure
+        """
+        # Fast path: already ensured, no lock or network roundtrip
+        if container_name in self._ensured_containers:
+            return
+        
+        # Created lazily so the lock binds to the running event loop
+        if self._ensure_lock is None:
+            self._ensure_lock = asyncio.Lock()
+        
+        async with self._ensure_lock:
+            if container_name in self._ensured_containers:
+                return
+            
+            container_client = self.blob_service_client.get_container_client(container_name)
+            try:
+                await container_client.create_container()
+                logger.info("Created container: %s", container_name)
+            except ResourceExistsError:
+                # Container already exists, which is fine
+                pass
+            except Exception as e:
+                # Let the upload itself surface the error; retry creation next time
+                logger.warning("Could not create container %s: %s", container_name, e)
+                return
+            self._ensured_containers.add(container_name)
+    
+    async def ensure_containers(self, *container_names: str):
+        """Ensure the given containers exist ahead of the first upload
+        
+        Args:
+            container_names: Container names to ensure
+        """
+        for container_name in container_names:
+            await self._ensure_container(container_name)
     
     async def download_blob_to_temp(self, blob_url: str) -> str:
         """Download blob to temporary file and return path
@@ -40,19 +148,14 @@ class BlobStorageManager:
             ValueError: If blob URL format is invalid
             Exception: If download fails
         """
+        temp_path = None
         try:
             # Parse blob URL to get container and blob name
-            parsed_url = urlparse(blob_url)
-            path_parts = parsed_url.path.lstrip('/').split('/', 1)
-            if len(path_parts) != 2:
+            match = _BLOB_URL_RE.match(blob_url)
+            if not match:
                 raise ValueError("Invalid blob URL format")
             
-            container_name, blob_name = path_parts
-            
-            # Create temporary file
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-            temp_path = temp_file.name
-            temp_file.close()
+            container_name, blob_name = match.group(1), match.group(2)
             
             # Download blob
             blob_client = self.blob_service_client.get_blob_client(
@@ -60,18 +163,97 @@ class BlobStorageManager:
                 blob=blob_name
             )
             
-            async with blob_client as client:
-                with open(temp_path, 'wb') as f:
-                    download_stream = await client.download_blob()
-                    async for chunk in download_stream.chunks():
-                        f.write(chunk)
+            # Create temporary file and hand its descriptor straight to the writer
+            fd, temp_path = tempfile.mkstemp(suffix='.pdf')
+            
+            # Write chunks without blocking the event loop
+            async with self._open_temp_writer(fd) as f:
+                download_stream = await blob_client.download_blob(max_concurrency=8)
+                async for chunk in download_stream.chunks():
+                    await f.write(chunk)
             
-            logger.info(f"Downloaded blob to temporary file: {temp_path}")
+            logger.info("Downloaded blob to temporary file: %s", temp_path)
             return temp_path
             
-        except Exception as e:
-            logger.error(f"Error downloading blob: {str(e)}")
+        except BaseException as e:
+            logger.error("Error downloading blob: %s", e)
+            # The writer has closed the descriptor; drop the partial file
+            if temp_path is not None:
+                os.unlink(temp_path)
+            raise
+    
+    async def download_blob_to_temp_streaming(
+        self,
+        blob_url: str,
+        chunk_size: int = 4 * 1024 * 1024,
+        max_concurrency: int = 8
+    ) -> str:
+        """Download a blob to a temporary file with parallel ranged GETs
+        
+        Each range is written at its own offset as soon as it arrives, so at
+        most max_concurrency chunks are held in memory. Blobs small enough for
+        a single GET use download_blob_to_temp instead.
+        
+        Args:
+            blob_url: Full URL to the blob
+            chunk_size: Size of each ranged GET in bytes
+            max_concurrency: Maximum number of ranges in flight
+            
+        Returns:
+            Path to the temporary file
+            
+        Raises:
+            ValueError: If blob URL format is invalid
+            Exception: If download fails
+        """
+        match = _BLOB_URL_RE.match(blob_url)
+        if not match:
+            raise ValueError("Invalid blob URL format")
+        
+        blob_client = self.blob_service_client.get_blob_client(
+            container=match.group(1),
+            blob=match.group(2)
+        )
+        properties = await blob_client.get_blob_properties()
+        size = properties.size
+        if size <= SINGLE_GET_SIZE:
+            return await self.download_blob_to_temp(blob_url)
+        
+        fd, temp_path = tempfile.mkstemp(suffix='.pdf')
+        semaphore = asyncio.Semaphore(max_concurrency)
+        loop = asyncio.get_running_loop()
+        # Writes in progress on worker threads; drained before the fd is closed
+        writes: List[asyncio.Future] = []
+        
+        async def fetch_range(offset: int):
+            async with semaphore:
+                stream = await blob_client.download_blob(
+                    offset=offset,
+                    length=min(chunk_size, size - offset),
+                    etag=properties.etag,
+                    match_condition=MatchConditions.IfNotModified
+                )
+                data = await stream.readall()
+                write = loop.run_in_executor(None, _pwrite_all, fd, data, offset)
+                writes.append(write)
+                await asyncio.shield(write)
+        
+        fetches = [asyncio.ensure_future(fetch_range(offset)) for offset in range(0, size, chunk_size)]
+        try:
+            await asyncio.gather(*fetches)
+            logger.info("Downloaded blob to temporary file: %s (%d bytes)", temp_path, size)
+            return temp_path
+            
+        except BaseException as e:
+            logger.error("Error downloading blob: %s", e)
+            for fetch in fetches:
+                fetch.cancel()
+            await asyncio.gather(*fetches, return_exceptions=True)
+            os.unlink(temp_path)
             raise
+        finally:
+            await asyncio.gather(*writes, return_exceptions=True)
+            os.close(fd)
     
     async def upload_json_to_blob(self, data: Dict, container_name: str, blob_name: str) -> str:
         """Upload JSON data to blob storage
@@ -84,18 +266,30 @@ class BlobStorageManager:
         Returns:
             URL of the uploaded blob
             
+        Raises:
+            Exception: If upload fails
+        """
+        return await self.upload_json_bytes_to_blob(
+            orjson.dumps(data, option=self._json_options), container_name, blob_name
+        )
+    
+    async def upload_json_bytes_to_blob(self, json_data: bytes, container_name: str, blob_name: str) -> str:
+        """Upload already-serialized JSON to blob storage
+        
+        Args:
+            json_data: Encoded JSON document
+            container_name: Target container name
+            blob_name: Target blob name
+            
+        Returns:
+            URL of the uploaded blob
+            
         Raises:
             Exception: If upload fails
         """
         try:
             # Ensure container exists
-            container_client = self.blob_service_client.get_container_client(container_name)
-            try:
-                await container_client.create_container()
-                logger.info(f"Created container: {container_name}")
-            except Exception:
-                # Container might already exist, which is fine
-                pass
+            await self._ensure_container(container_name)
             
             # Upload JSON data
             blob_client = self.blob_service_client.get_blob_client(
@@ -103,17 +297,16 @@ class BlobStorageManager:
                 blob=blob_name
             )
             
-            json_data = json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
-            
-            async with blob_client as client:
-                await client.upload_blob(json_data, overwrite=True)
+            await blob_client.upload_blob(
+                json_data, overwrite=True, content_settings=JSON_CONTENT_SETTINGS
+            )
             
-            blob_url = f"https://{self.blob_service_client.account_name}.blob.core.windows.net/{container_name}/{blob_name}"
-            logger.info(f"Uploaded JSON to blob: {blob_url}")
+            blob_url = self._url_prefix + f"{container_name}/{blob_name}"
+            logger.info("Uploaded JSON to blob: %s", blob_url)
             return blob_url
             
         except Exception as e:
-            logger.error(f"Error uploading to blob: {str(e)}")
+            logger.error("Error uploading to blob: %s", e)
             raise
     
     async def upload_file_to_blob(self, file_path: str, container_name: str, blob_name: str) -> str:
@@ -132,13 +325,7 @@ class BlobStorageManager:
         """
         try:
             # Ensure container exists
-            container_client = self.blob_service_client.get_container_client(container_name)
-            try:
-                await container_client.create_container()
-                logger.info(f"Created container: {container_name}")
-            except Exception:
-                # Container might already exist, which is fine
-                pass
+            await self._ensure_container(container_name)
             
             # Upload file
             blob_client = self.blob_service_client.get_blob_client(
@@ -146,16 +333,21 @@ class BlobStorageManager:
                 blob=blob_name
             )
             
-            async with blob_client as client:
-                with open(file_path, 'rb') as f:
-                    await client.upload_blob(f, overwrite=True)
+            # Stage blocks in parallel; a known length lets the SDK pick the block size
+            with open(file_path, 'rb') as f:
+                await blob_client.upload_blob(
+                    f,
+                    overwrite=True,
+                    max_concurrency=8,
+                    length=os.path.getsize(file_path)
+                )
             
-            blob_url = f"https://{self.blob_service_client.account_name}.blob.core.windows.net/{container_name}/{blob_name}"
-            logger.info(f"Uploaded file to blob: {blob_url}")
+            blob_url = self._url_prefix + f"{container_name}/{blob_name}"
+            logger.info("Uploaded file to blob: %s", blob_url)
             return blob_url
             
         except Exception as e:
-            logger.error(f"Error uploading file to blob: {str(e)}")
+            logger.error("Error uploading file to blob: %s", e)
             raise
     
     async def blob_exists(self, blob_url: str) -> bool:
@@ -166,27 +358,27 @@ class BlobStorageManager:
             
         Returns:
             True if blob exists, False otherwise
+            
+        Raises:
+            ValueError: If blob URL format is invalid
+            Exception: If the existence check fails for reasons other than a missing blob
         """
+        # Parse blob URL to get container and blob name
+        match = _BLOB_URL_RE.match(blob_url)
+        if not match:
+            raise ValueError("Invalid blob URL format")
+        
+        container_name, blob_name = match.group(1), match.group(2)
+        
+        # Check if blob exists; network errors propagate so callers can retry
+        blob_client = self.blob_service_client.get_blob_client(
+            container=container_name,
+            blob=blob_name
+        )
+        
         try:
-            # Parse blob URL to get container and blob name
-            parsed_url = urlparse(blob_url)
-            path_parts = parsed_url.path.lstrip('/').split('/', 1)
-            if len(path_parts) != 2:
-                return False
-            
-            container_name, blob_name = path_parts
-            
-            # Check if blob exists
-            blob_client = self.blob_service_client.get_blob_client(
-                container=container_name,
-                blob=blob_name
-            )
-            
-            async with blob_client as client:
-                return await client.exists()
-                
-        except Exception as e:
-            logger.error(f"Error checking blob existence: {str(e)}")
+            return await blob_client.exists()
+        except ResourceNotFoundError:
             return False
     
     def get_storage_info(self) -> Dict:
@@ -196,6 +388,6 @@ class BlobStorageManager:
             Dictionary with storage information
         """
         return {
-            "account_name": self.blob_service_client.account_name,
+            "account_name": self._account_name,
             "connection_string_configured": bool(self.connection_string),
         }
@@ -4,18 +4,130 @@ File Manager
 Handles file operations using existing Dolphin module functions.
 """
 
+import asyncio
 import logging
 import os
+import shutil
 import tempfile
+import threading
+from collections import deque
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Optional
+from typing import BinaryIO, Deque, Dict, Iterator, Optional, Set, Tuple, Union
 
+import pymupdf
+from fastapi import UploadFile
 from PIL import Image
 
-from Dolphin.utils.utils import convert_pdf_to_images, is_pdf_file
+from Dolphin.utils.utils import is_pdf_file
+
+from .uring_writer import URING_SUPPORTED, UringWriter
 
 logger = logging.getLogger(__name__)
 
+# Read size used when streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Chunk writes submitted per io_uring_enter when copying uploads
+URING_UPLOAD_QUEUE_DEPTH = 8
+
+# Upload bytes held in unfinished io_uring writes before the copy waits on the disk
+URING_UPLOAD_MAX_PENDING = URING_UPLOAD_QUEUE_DEPTH * UPLOAD_CHUNK_SIZE
+
+# Number of idle temp files kept for reuse per suffix
+TEMP_FILE_POOL_SIZE = 32
+
+# Every PDF starts with this header
+PDF_MAGIC = b"%PDF-"
+
+
+@lru_cache(maxsize=256)
+def _pdf_page_count(path: str, mtime_ns: int, size: int) -> int:
+    """Page count of a PDF, memoized per file version (mtime and size are cache keys)"""
+    with pymupdf.open(path) as doc:
+        return doc.page_count
+
+
+class _TempFilePool:
+    """Recycles temporary files instead of creating and unlinking one per upload
+    
+    Released files are truncated and kept for the next upload with the same
+    suffix. When no idle file is available a new one is created with mkstemp,
+    and files released beyond the pool size are unlinked as usual. No files
+    exist until the first lease, so the pool only ever grows to the number of
+    uploads that were in flight at once.
+    """
+    
+    def __init__(self, directory: str, pool_size: int = TEMP_FILE_POOL_SIZE):
+        """Initialize the pool
+        
+        Args:
+            directory: Directory the temporary files live in
+            pool_size: Maximum number of idle files kept per suffix
+        """
+        self.directory = directory
+        self.pool_size = pool_size
+        self._idle: Dict[str, Deque[str]] = {}
+        self._leased: Set[str] = set()
+        self._lock = threading.Lock()
+    
+    def _create(self, suffix: str) -> str:
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.directory)
+        os.close(fd)
+        return path
+    
+    def acquire(self, suffix: str) -> str:
+        """Lease an empty temporary file
+        
+        Args:
+            suffix: File suffix the path must end with
+            
+        Returns:
+            Path to an empty temporary file
+        """
+        with self._lock:
+            idle = self._idle.get(suffix)
+            path = idle.pop() if idle else None
+            if path is None:
+                path = self._create(suffix)
+            self._leased.add(path)
+        return path
+    
+    def release(self, path: str) -> bool:
+        """Return a leased file to the pool
+        
+        Args:
+            path: Path previously returned by acquire
+            
+        Returns:
+            True if the file was recycled, False if it was not leased or the
+            pool for its suffix is already full
+        """
+        with self._lock:
+            if path not in self._leased:
+                return False
+            self._leased.discard(path)
+            idle = self._idle.setdefault(os.path.splitext(path)[1], deque())
+            if len(idle) >= self.pool_size:
+                return False
+            # Free the data blocks now but keep the inode for the next upload
+            try:
+                os.truncate(path, 0)
+            except OSError:
+                return False
+            idle.append(path)
+        return True
+    
+    def close(self):
+        """Unlink all idle files"""
+        with self._lock:
+            for idle in self._idle.values():
+                while idle:
+                    try:
+                        os.unlink(idle.pop())
+                    except OSError:
+                        pass
+
 
 class FileManager:
     """Handles file extraction and conversion operations"""
@@ -27,37 +139,99 @@ class FileManager:
             temp_dir: Directory for temporary files (defaults to system temp)
         """
         self.temp_dir = temp_dir or tempfile.gettempdir()
+        # Created on the first upload, so file managers that never save uploads
+        # (such as the one in each inference worker process) own no temp files
+        self._temp_pool: Optional[_TempFilePool] = None
+        self._temp_pool_lock = threading.Lock()
+        # Cleared after the first io_uring failure (e.g. blocked by seccomp)
+        self._use_uring = URING_SUPPORTED
+    
+    def close(self):
+        """Remove the idle pooled temporary files"""
+        if self._temp_pool is not None:
+            self._temp_pool.close()
     
-    def convert_pdf_to_images(self, pdf_path: str, target_size: int = 896) -> List[Image.Image]:
-        """Convert PDF pages to images using existing Dolphin function
+    def _lease_temp_file(self, suffix: str) -> str:
+        """Lease an empty pooled temporary file, creating the pool on first use"""
+        if self._temp_pool is None:
+            with self._temp_pool_lock:
+                if self._temp_pool is None:
+                    self._temp_pool = _TempFilePool(self.temp_dir)
+        return self._temp_pool.acquire(suffix)
+    
+    def convert_pdf_to_images(self, pdf_path: str, target_size: int = 896) -> Iterator[Image.Image]:
+        """Convert PDF pages to images by rendering them directly with PyMuPDF
+        
+        Pages are rendered lazily, one at a time, so only the page being
+        consumed is held in memory. Single-page documents, the most common
+        upload, are rendered immediately without the lazy page loop. Each page
+        is rasterized so its longest side matches target_size and the pixmap
+        samples are wrapped as a PIL image without an encode round-trip.
         
         Args:
             pdf_path: Path to the PDF file
             target_size: Target size for the longest dimension
             
         Returns:
-            List of PIL Images
+            Iterator over a PIL Image for each page, in order
             
         Raises:
             Exception: If PDF conversion fails
         """
+        logger.info("Converting PDF to images: %s", pdf_path)
+        try:
+            doc = pymupdf.open(pdf_path)
+            if doc.page_count != 1:
+                return self._iter_page_images(doc, pdf_path, target_size)
+            
+            # Fast path: render the only page directly
+            try:
+                image = self._render_page(doc[0], target_size)
+            finally:
+                doc.close()
+            return iter((image,))
+            
+        except (RuntimeError, OSError, ValueError):
+            # pymupdf.FileDataError is a RuntimeError
+            logger.exception("Error converting PDF to images: %s", pdf_path)
+            raise
+    
+    def _iter_page_images(self, doc, pdf_path: str, target_size: int) -> Iterator[Image.Image]:
+        """Lazily render every page of an open document, closing it when done"""
         try:
-            logger.info(f"Converting PDF to images: {pdf_path}")
-            images = convert_pdf_to_images(pdf_path, target_size)
-            if not images:
-                raise Exception(f"Failed to convert PDF {pdf_path} to images")
-            logger.info(f"Successfully converted {len(images)} pages from PDF")
-            return images
-            
-        except Exception as e:
-            logger.error(f"Error converting PDF to images: {str(e)}")
+            page_count = 0
+            with doc:
+                for page in doc.pages():
+                    page_count += 1
+                    yield self._render_page(page, target_size)
+            if not page_count:
+                raise ValueError(f"Failed to convert PDF {pdf_path} to images")
+            logger.info("Successfully converted %d pages from PDF", page_count)
+            
+        except (RuntimeError, OSError, ValueError):
+            logger.exception("Error converting PDF to images: %s", pdf_path)
             raise
     
-    def save_upload_to_temp(self, file_content: bytes, filename: str, suffix: str = None) -> str:
+    @staticmethod
+    def _render_page(page, target_size: int) -> Image.Image:
+        """Rasterize one page so its longest side matches target_size"""
+        scale = target_size / max(page.rect.width, page.rect.height)
+        pix = page.get_pixmap(
+            matrix=pymupdf.Matrix(scale, scale),
+            colorspace=pymupdf.csRGB,
+            alpha=False
+        )
+        # The image keeps a reference to the samples; the pixmap itself is freed on return
+        return Image.frombuffer(
+            "RGB", (pix.width, pix.height), pix.samples, "raw", "RGB", pix.stride, 1
+        )
+    
+    def save_upload_to_temp(self, file_content: Union[bytes, BinaryIO], filename: str, suffix: str = None) -> str:
         """Save uploaded file content to temporary file
         
         Args:
-            file_content: File content as bytes
+            file_content: File content as bytes, or a binary file object
+                (e.g. UploadFile.file) that is copied in chunks
             filename: Original filename
             suffix: File suffix (defaults to original extension)
             
@@ -69,28 +243,124 @@ class FileManager:
             if suffix is None:
                 suffix = Path(filename).suffix
             
-            # Create temporary file
-            temp_file = tempfile.NamedTemporaryFile(
-                delete=False, 
-                suffix=suffix,
-                dir=self.temp_dir
+            temp_path, _ = self._write_to_temp(file_content, suffix)
+            
+            logger.info("Saved upload to temporary file: %s", temp_path)
+            return temp_path
+            
+        except OSError:
+            logger.exception("Error saving upload %s to temp file", filename)
+            raise
+    
+    def _write_to_temp(self, content: Union[bytes, BinaryIO], suffix: str) -> Tuple[str, int]:
+        """Write bytes or a binary stream into a pooled temporary file
+        
+        Streams are copied through one reusable chunk buffer.
+        
+        Args:
+            content: File content as bytes, or a binary file object
+            suffix: File suffix
+            
+        Returns:
+            Tuple of (path to the temporary file, number of bytes written)
+        """
+        temp_path = self._lease_temp_file(suffix)
+        if self._use_uring and not isinstance(content, (bytes, bytearray, memoryview)):
+            try:
+                return temp_path, self._write_stream_uring(content, temp_path)
+            except OSError as e:
+                logger.warning("io_uring write failed, falling back to buffered I/O: %s", e)
+                self._use_uring = False
+                content.seek(0)
+        
+        with open(temp_path, 'wb') as temp_file:
+            if isinstance(content, (bytes, bytearray, memoryview)):
+                return temp_path, temp_file.write(content)
+            
+            if not hasattr(content, "readinto"):
+                shutil.copyfileobj(content, temp_file, UPLOAD_CHUNK_SIZE)
+                return temp_path, temp_file.tell()
+            
+            buffer = bytearray(UPLOAD_CHUNK_SIZE)
+            view = memoryview(buffer)
+            size = 0
+            while n := content.readinto(buffer):
+                temp_file.write(view[:n])
+                size += n
+            return temp_path, size
+    
+    def _write_stream_uring(self, content: BinaryIO, temp_path: str) -> int:
+        """Copy a binary stream into a file, submitting chunk writes in batches via io_uring
+        
+        Args:
+            content: Binary file object to copy
+            temp_path: Destination file, truncated first
+            
+        Returns:
+            Number of bytes written
+        """
+        fd = os.open(temp_path, os.O_WRONLY | os.O_TRUNC | os.O_CLOEXEC)
+        try:
+            writer = UringWriter(
+                fd, queue_depth=URING_UPLOAD_QUEUE_DEPTH, max_pending_bytes=URING_UPLOAD_MAX_PENDING
             )
-            temp_path = temp_file.name
-            temp_file.close()
+        except BaseException:
+            # The writer only owns the fd once it has been constructed
+            os.close(fd)
+            raise
+        size = 0
+        try:
+            while chunk := content.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if writer.queue(chunk):
+                    writer.flush_sync()
+        finally:
+            writer.close_sync()
+        return size
+    
+    async def stream_upload_to_temp(self, upload: UploadFile, suffix: str = None) -> Tuple[str, int]:
+        """Stream an uploaded file to a temporary file in fixed-size chunks
+        
+        Peak memory stays at one chunk regardless of the upload size.
+        
+        Args:
+            upload: FastAPI uploaded file
+            suffix: File suffix (defaults to original extension)
             
-            # Write content to file
-            with open(temp_path, 'wb') as f:
-                f.write(file_content)
+        Returns:
+            Tuple of (path to the temporary file, number of bytes written)
+        """
+        try:
+            if suffix is None:
+                suffix = Path(upload.filename).suffix
             
-            logger.info(f"Saved upload to temporary file: {temp_path}")
-            return temp_path
+            # One thread hop for the whole copy instead of two per chunk
+            await upload.seek(0)
+            temp_path, size = await asyncio.to_thread(self._write_to_temp, upload.file, suffix)
+            
+            logger.info("Streamed upload to temporary file: %s (%d bytes)", temp_path, size)
+            return temp_path, size
             
-        except Exception as e:
-            logger.error(f"Error saving upload to temp file: {str(e)}")
+        except OSError:
+            logger.exception("Error streaming upload %s to temp file", upload.filename)
             raise
     
+    async def has_pdf_header(self, upload: UploadFile) -> bool:
+        """Check an upload's leading bytes for the PDF header before saving it
+        
+        Args:
+            upload: FastAPI uploaded file
+            
+        Returns:
+            True if the upload starts with the PDF magic bytes
+        """
+        await upload.seek(0)
+        head = await upload.read(len(PDF_MAGIC))
+        await upload.seek(0)
+        return head == PDF_MAGIC
+    
     def validate_pdf_file(self, file_path: str) -> bool:
-        """Validate that a file is a valid PDF using existing Dolphin function
+        """Validate that a file is a valid PDF without rasterizing it
         
         Args:
             file_path: Path to the file to validate
@@ -107,12 +377,13 @@ class FileManager:
             if not is_pdf_file(file_path):
                 return False
             
-            # Additional validation by trying to convert to images
-            images = self.convert_pdf_to_images(file_path)
-            return len(images) > 0
+            # Structural check: the document opens, has pages and is not encrypted
+            with pymupdf.open(file_path) as doc:
+                return doc.page_count > 0 and not doc.needs_pass
             
-        except Exception as e:
-            logger.warning(f"PDF validation failed: {str(e)}")
+        except (RuntimeError, OSError, ValueError):
+            # pymupdf.FileDataError is a RuntimeError
+            logger.exception("PDF validation failed: %s", file_path)
             return False
     
     def get_file_info(self, file_path: str) -> dict:
@@ -125,49 +396,61 @@ class FileManager:
             Dictionary with file information
         """
         try:
-            file_path_obj = Path(file_path)
-            stat = file_path_obj.stat()
+            filename = os.path.basename(file_path)
+            extension = os.path.splitext(filename)[1]
+            
+            # A single stat serves both the existence check and the size
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                return {"filename": filename, "extension": extension, "exists": False}
             
             info = {
-                "filename": file_path_obj.name,
+                "filename": filename,
                 "size_bytes": stat.st_size,
                 "size_mb": round(stat.st_size / (1024 * 1024), 2),
-                "extension": file_path_obj.suffix,
-                "exists": file_path_obj.exists()
+                "extension": extension,
+                "exists": True
             }
             
             # Add PDF-specific info if it's a PDF
-            if file_path_obj.suffix.lower() == '.pdf' and info["exists"]:
+            if extension.lower() == '.pdf':
                 try:
-                    doc = pymupdf.open(file_path)
-                    info["pdf_pages"] = len(doc)
-                    doc.close()
-                except Exception:
+                    info["pdf_pages"] = _pdf_page_count(
+                        str(file_path), stat.st_mtime_ns, stat.st_size
+                    )
+                except (RuntimeError, OSError, ValueError):
                     info["pdf_pages"] = "unknown"
             
             return info
             
-        except Exception as e:
-            logger.error(f"Error getting file info: {str(e)}")
+        except OSError as e:
+            logger.exception("Error getting file info: %s", file_path)
             return {"error": str(e)}
     
     def cleanup_temp_file(self, file_path: str) -> bool:
         """Clean up a temporary file
         
+        Pooled upload files are truncated and kept for reuse; other files are
+        deleted.
+        
         Args:
             file_path: Path to the temporary file
             
         Returns:
-            True if successfully deleted, False otherwise
+            True if successfully recycled or deleted, False otherwise
         """
         try:
+            if self._temp_pool is not None and self._temp_pool.release(file_path):
+                logger.info("Recycled temporary file: %s", file_path)
+                return True
             if os.path.exists(file_path):
                 os.unlink(file_path)
-                logger.info(f"Cleaned up temporary file: {file_path}")
+                logger.info("Cleaned up temporary file: %s", file_path)
                 return True
             return False
-        except Exception as e:
-            logger.error(f"Error cleaning up temp file: {str(e)}")
+        except OSError:
+            logger.exception("Error cleaning up temp file: %s", file_path)
             return False
     
     def create_temp_directory(self, prefix: str = "dolphin_") -> str:
@@ -181,10 +464,10 @@ class FileManager:
         """
         try:
             temp_dir = tempfile.mkdtemp(prefix=prefix, dir=self.temp_dir)
-            logger.info(f"Created temporary directory: {temp_dir}")
+            logger.info("Created temporary directory: %s", temp_dir)
             return temp_dir
-        except Exception as e:
-            logger.error(f"Error creating temp directory: {str(e)}")
+        except OSError:
+            logger.exception("Error creating temp directory in %s", self.temp_dir)
             raise
     
     def cleanup_temp_directory(self, dir_path: str) -> bool:
@@ -197,12 +480,11 @@ class FileManager:
             True if successfully deleted, False otherwise
         """
         try:
-            import shutil
             if os.path.exists(dir_path):
                 shutil.rmtree(dir_path)
-                logger.info(f"Cleaned up temporary directory: {dir_path}")
+                logger.info("Cleaned up temporary directory: %s", dir_path)
                 return True
             return False
-        except Exception as e:
-            logger.error(f"Error cleaning up temp directory: {str(e)}")
+        except OSError:
+            logger.exception("Error cleaning up temp directory: %s", dir_path)
             return False
@@ -7,12 +7,19 @@ Uses process pool for true parallelism to avoid blocking the event loop.
 
 import asyncio
 import logging
+import multiprocessing
+import queue
+import threading
+import time
+from collections import OrderedDict
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from enum import Enum
-from typing import Dict, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 from dataclasses import dataclass, field
 
+from PIL import Image
+
 logger = logging.getLogger(__name__)
 
 
@@ -24,42 +31,229 @@ class TaskStatus(str, Enum):
     FAILED = "failed"
 
 
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    """Render an epoch timestamp as a local ISO 8601 string"""
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp is not None else None
+
+
 @dataclass
 class TaskInfo:
-    """Information about a background task"""
+    """Information about a background task
+    
+    Timestamps are stored as epoch seconds and only rendered as ISO strings
+    when the task is serialized.
+    """
     task_id: str
     status: TaskStatus
-    created_at: str
-    started_at: Optional[str] = None
-    completed_at: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    completed_at: Optional[float] = None
     progress: Optional[Dict] = None
     result: Optional[Dict] = None
     error: Optional[str] = None
     source_url: Optional[str] = None
     source_filename: Optional[str] = None
+    
+    def to_status_dict(self) -> Dict:
+        """Serialize the task for status responses
+        
+        Returns:
+            Dictionary matching TaskStatusResponse, with ISO timestamps
+        """
+        return {
+            "task_id": self.task_id,
+            "status": self.status.value,
+            "created_at": _isoformat(self.created_at),
+            "started_at": _isoformat(self.started_at),
+            "completed_at": _isoformat(self.completed_at),
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "source_url": self.source_url,
+            "source_filename": self.source_filename
+        }
+
+
+# How long a cached task list projection may be served before rebuilding
+LIST_CACHE_TTL_SECONDS = 0.5
+
+# Upper bound on tracked tasks; the oldest finished tasks are evicted beyond it
+MAX_TRACKED_TASKS = 10_000
+
+_FINISHED_STATUSES = (TaskStatus.COMPLETED, TaskStatus.FAILED)
+
+# Per-process processing service, set by _init_inference_worker in pool workers
+_worker_service = None
+
+
+def _init_inference_worker(model_path: str):
+    """Load the Dolphin model once in an inference worker process
+    
+    Args:
+        model_path: Path to the Dolphin model directory
+    """
+    global _worker_service
+    # Imported here to avoid a circular import with the services package
+    from ..processors import DolphinProcessor
+    from ..services import PDFProcessingService
+    
+    processor = DolphinProcessor(model_path)
+    processor.warmup()
+    _worker_service = PDFProcessingService(processor)
+
+
+def _noop():
+    """Trivial job used to start inference worker processes eagerly"""
+
+
+def _process_pdf_in_worker(
+    pdf_path: str,
+    task_id: str,
+    source_url: Optional[str],
+    source_filename: Optional[str],
+    max_batch_size: int
+):
+    """Process a PDF with the worker process's own model
+    
+    Top-level so it can be pickled by ProcessPoolExecutor. The worker renders
+    the pages from pdf_path itself, so no page images cross the process boundary.
+    """
+    return _worker_service._process_pdf_file_sync(
+        pdf_path=pdf_path,
+        task_id=task_id,
+        source_url=source_url,
+        source_filename=source_filename,
+        max_batch_size=max_batch_size
+    )
+
+
+class _PageQueue:
+    """Bounded hand-off of rendered pages from the rasterization pool to inference
+    
+    The producer blocks once maxsize pages are waiting, so at most one batch is
+    rendered ahead of the model regardless of the document's page count.
+    """
+    
+    _DONE = object()
+    
+    def __init__(self, maxsize: int):
+        self._queue: "queue.Queue" = queue.Queue(maxsize)
+        self._closed = threading.Event()
+    
+    def produce(self, render: Callable[[str], Iterable[Image.Image]], pdf_path: str):
+        """Render pdf_path and feed its pages into the queue; runs on the rasterization pool
+        
+        A rendering error is handed to the consumer instead of raised here.
+        """
+        pages = None
+        try:
+            pages = render(pdf_path)
+            for page in pages:
+                if not self._put(page):
+                    page.close()
+                    return
+            self._put(self._DONE)
+        except Exception as e:
+            self._put(e)
+        finally:
+            # Closes the document if rendering stopped early
+            close = getattr(pages, "close", None)
+            if close:
+                close()
+            if self._closed.is_set():
+                # Pages enqueued while the queue was being closed
+                self._drain()
+    
+    def __iter__(self) -> Iterator[Image.Image]:
+        while not self._closed.is_set():
+            try:
+                item = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                # Poll so closing the queue also releases a waiting consumer
+                continue
+            if item is self._DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    
+    def close(self):
+        """Stop the producer and consumer and close any pages left in the queue"""
+        self._closed.set()
+        self._drain()
+    
+    def _drain(self):
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, Image.Image):
+                item.close()
+    
+    def _put(self, item) -> bool:
+        """Enqueue item, waiting for space; False once the queue is closed"""
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
 
 
 class BackgroundTaskManager:
     """Manages background PDF processing tasks
     
-    Uses ThreadPoolExecutor to run CPU-bound work in separate threads,
-    preventing the event loop from being blocked during PDF processing.
+    Processing is a two-stage pipeline running on separate pools: PDF
+    rasterization runs on a CPU thread pool and model inference on a GPU pool
+    (threads by default, or processes with their own model when enabled).
+    Pages flow between the stages through a bounded queue, so rendering
+    overlaps with inference while only about one batch of pages is held
+    ahead of the model. Inference processes render their own pages.
     """
     
-    def __init__(self, max_workers: int = 1):
+    def __init__(
+        self,
+        gpu_workers: int = 1,
+        cpu_workers: int = 1,
+        inference_processes: bool = False,
+        model_path: Optional[str] = None,
+        max_tracked_tasks: int = MAX_TRACKED_TASKS
+    ):
         """Initialize the task manager
         
         Args:
-            max_workers: Maximum number of concurrent processing workers
+            gpu_workers: Maximum number of concurrent model inference workers
+            cpu_workers: Maximum number of concurrent rasterization workers
+            inference_processes: Run inference in worker processes, each loading
+                its own model, instead of threads sharing the service's model
+            model_path: Model directory loaded by each inference process
+            max_tracked_tasks: Number of tasks kept before the oldest finished
+                ones are evicted
         """
-        self.tasks: Dict[str, TaskInfo] = {}
-        self.processing_queue: asyncio.Queue = asyncio.Queue()
-        self.worker_task: Optional[asyncio.Task] = None
+        # Insertion-ordered so the oldest finished tasks are evicted first
+        self.tasks: "OrderedDict[str, TaskInfo]" = OrderedDict()
+        self.max_tracked_tasks = max_tracked_tasks
+        # Running per-status counts, kept in step with self.tasks
+        self._status_counts: Dict[TaskStatus, int] = {status: 0 for status in TaskStatus}
+        # Coroutines driving submitted tasks through the pipeline
+        self._inflight: Set[asyncio.Task] = set()
+        # Caps tasks between rasterization and inference so rendered pages
+        # don't pile up ahead of the GPU; created in start_worker
+        self._pipeline_slots: Optional[asyncio.Semaphore] = None
         self._processing_service = None
         self._worker_running = False
         self._tasks_processed = 0
-        self.max_workers = max_workers
-        self.executor: Optional[ThreadPoolExecutor] = None
+        self.gpu_workers = gpu_workers
+        self.cpu_workers = cpu_workers
+        self.inference_processes = inference_processes
+        self.model_path = model_path
+        self.executor: Optional[Union[ThreadPoolExecutor, ProcessPoolExecutor]] = None
+        self.cpu_executor: Optional[ThreadPoolExecutor] = None
+        # Set by stop_worker; executors only expose their state through private attributes
+        self._executor_shut_down = False
+        self._list_cache: Optional[Tuple[float, List[Dict]]] = None
         
     def set_processing_service(self, service):
         """Set the processing service instance
@@ -70,34 +264,52 @@ class BackgroundTaskManager:
         self._processing_service = service
     
     async def start_worker(self):
-        """Start the background worker and thread pool"""
-        # Initialize thread pool executor
-        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
-        logger.info(f"Thread pool initialized with {self.max_workers} workers")
+        """Start the executors that run background tasks"""
+        # Initialize executors
+        if self.inference_processes:
+            # Spawn rather than fork so workers never inherit CUDA state
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.gpu_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_inference_worker,
+                initargs=(self.model_path,)
+            )
+            # Workers spawn on demand; start them now so model loading and
+            # warmup happen at startup rather than on the first task
+            for _ in range(self.gpu_workers):
+                self.executor.submit(_noop)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.gpu_workers)
+        self.cpu_executor = ThreadPoolExecutor(max_workers=self.cpu_workers)
+        self._executor_shut_down = False
+        # Register PIL image plugins now instead of on the first decode
+        Image.init()
+        logger.info(
+            f"Executors initialized with {self.gpu_workers} GPU "
+            f"{'process' if self.inference_processes else 'thread'}(s) "
+            f"and {self.cpu_workers} CPU worker(s)"
+        )
         
-        if self.worker_task is None or self.worker_task.done():
-            self.worker_task = asyncio.create_task(self._worker())
-            self._worker_running = True
-            logger.info("Background worker started")
-            # Give the worker a moment to initialize
-            await asyncio.sleep(0.1)
+        self._pipeline_slots = asyncio.Semaphore(self.gpu_workers + self.cpu_workers)
+        self._worker_running = True
+        logger.info("Background worker started")
     
     async def stop_worker(self):
-        """Stop the background worker and shutdown thread pool"""
+        """Cancel in-flight tasks and shutdown the executors"""
         self._worker_running = False
-        if self.worker_task and not self.worker_task.done():
-            self.worker_task.cancel()
-            try:
-                await self.worker_task
-            except asyncio.CancelledError:
-                pass
-            logger.info("Background worker stopped")
+        inflight = list(self._inflight)
+        for task in inflight:
+            task.cancel()
+        await asyncio.gather(*inflight, return_exceptions=True)
+        logger.info("Background worker stopped")
         
-        # Shutdown thread pool
-        if self.executor:
-            logger.info("Shutting down thread pool...")
-            self.executor.shutdown(wait=True)
-            logger.info("Thread pool shutdown complete")
+        # Shutdown executors
+        self._executor_shut_down = True
+        for executor in (self.cpu_executor, self.executor):
+            if executor:
+                logger.info("Shutting down executor...")
+                executor.shutdown(wait=True)
+                logger.info("Executor shutdown complete")
     
     async def submit_task(
         self,
@@ -124,24 +336,29 @@ class BackgroundTaskManager:
         task_info = TaskInfo(
             task_id=task_id,
             status=TaskStatus.PENDING,
-            created_at=datetime.now().isoformat(),
+            created_at=time.time(),
             source_url=source_url,
             source_filename=source_filename
         )
         
         self.tasks[task_id] = task_info
+        self._status_counts[TaskStatus.PENDING] += 1
+        self._evict_finished_tasks()
+        self.invalidate_list_cache()
         
-        # Add to processing queue
-        await self.processing_queue.put({
+        # Fan out straight to the executors; their queues provide FIFO ordering
+        task = asyncio.create_task(self._run_task({
             "task_id": task_id,
             "pdf_path": pdf_path,
             "source_url": source_url,
             "source_filename": source_filename,
             "output_container": output_container,
             "max_batch_size": max_batch_size
-        })
+        }))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
         
-        logger.info(f"Task {task_id} submitted to queue")
+        logger.info("Task %s submitted", task_id)
         return task_info
     
     def get_task_status(self, task_id: str) -> Optional[TaskInfo]:
@@ -163,6 +380,63 @@ class BackgroundTaskManager:
         """
         return self.tasks.copy()
     
+    def _set_status(self, task_info: TaskInfo, status: TaskStatus):
+        """Move a task to a new status, keeping the status counts in step"""
+        if task_info.task_id in self.tasks:
+            self._status_counts[task_info.status] -= 1
+            self._status_counts[status] += 1
+        task_info.status = status
+        self.invalidate_list_cache()
+    
+    def _evict_finished_tasks(self):
+        """Drop the oldest completed or failed tasks beyond max_tracked_tasks"""
+        excess = len(self.tasks) - self.max_tracked_tasks
+        if excess <= 0:
+            return
+        
+        evicted = []
+        for task_id, task in self.tasks.items():
+            if len(evicted) >= excess:
+                break
+            if task.status in _FINISHED_STATUSES:
+                evicted.append(task_id)
+        
+        for task_id in evicted:
+            task = self.tasks.pop(task_id)
+            self._status_counts[task.status] -= 1
+    
+    def invalidate_list_cache(self):
+        """Drop the cached task list projection after a task state change"""
+        self._list_cache = None
+    
+    def get_list_view(self) -> List[Dict]:
+        """Get a lightweight projection of all tasks for listing
+        
+        The projection is cached briefly so frequent polling does not
+        rebuild it on every request.
+        
+        Returns:
+            List of task summary dictionaries
+        """
+        now = time.monotonic()
+        cached = self._list_cache
+        if cached is not None and now - cached[0] < LIST_CACHE_TTL_SECONDS:
+            return cached[1]
+        
+        view = [
+            {
+                "task_id": task.task_id,
+                "status": task.status.value,
+                "created_at": _isoformat(task.created_at),
+                "completed_at": _isoformat(task.completed_at),
+                "source_url": task.source_url,
+                "source_filename": task.source_filename
+            }
+            for task in self.tasks.values()
+        ]
+        self._list_cache = (now, view)
+        return view
+    
     def get_worker_status(self) -> Dict:
         """Get worker status information
         
@@ -171,98 +445,133 @@ class BackgroundTaskManager:
         """
         return {
             "worker_running": self._worker_running,
-            "worker_alive": self.worker_task and not self.worker_task.done() if self.worker_task else False,
-            "executor_type": "ThreadPoolExecutor",
-            "max_workers": self.max_workers,
-            "executor_running": self.executor is not None and not self.executor._shutdown,
-            "queue_size": self.processing_queue.qsize(),
+            "executor_type": type(self.executor).__name__ if self.executor else None,
+            "gpu_workers": self.gpu_workers,
+            "cpu_workers": self.cpu_workers,
+            "executor_running": self.executor is not None and not self._executor_shut_down,
+            "queue_size": self._status_counts[TaskStatus.PENDING],
+            "in_flight_tasks": len(self._inflight),
             "total_tasks": len(self.tasks),
             "tasks_processed": self._tasks_processed,
-            "pending_tasks": sum(1 for t in self.tasks.values() if t.status == TaskStatus.PENDING),
-            "processing_tasks": sum(1 for t in self.tasks.values() if t.status == TaskStatus.PROCESSING),
-            "completed_tasks": sum(1 for t in self.tasks.values() if t.status == TaskStatus.COMPLETED),
-            "failed_tasks": sum(1 for t in self.tasks.values() if t.status == TaskStatus.FAILED),
+            "pending_tasks": self._status_counts[TaskStatus.PENDING],
+            "processing_tasks": self._status_counts[TaskStatus.PROCESSING],
+            "completed_tasks": self._status_counts[TaskStatus.COMPLETED],
+            "failed_tasks": self._status_counts[TaskStatus.FAILED],
         }
     
-    async def _worker(self):
-        """Background worker that processes tasks from the queue"""
-        logger.info("Background worker loop started")
+    async def _run_task(self, task_data: Dict):
+        """Rasterize, run inference on and store the results of one task
         
-        while True:
+        Rasterization runs on the CPU pool and inference on the GPU pool, so
+        one task's pages render while another task is on the GPU. The result
+        upload happens after the task leaves the pipeline, so it overlaps with
+        the next task's inference instead of holding its slot.
+        
+        Args:
+            task_data: Parameters captured by submit_task
+        """
+        task_id = task_data["task_id"]
+        task_info = self.tasks[task_id]
+        pages = None
+        rasterizing = None
+        
+        async with self._pipeline_slots:
+            logger.info("Processing task %s", task_id)
+            task_info.started_at = time.time()
+            self._set_status(task_info, TaskStatus.PROCESSING)
+            
             try:
-                # Get next task from queue
-                task_data = await self.processing_queue.get()
-                task_id = task_data["task_id"]
-                
-                logger.info(f"Processing task {task_id}")
-                
-                # Update task status
-                task_info = self.tasks[task_id]
-                task_info.status = TaskStatus.PROCESSING
-                task_info.started_at = datetime.now().isoformat()
-                
-                try:
-                    # Process the PDF in thread pool to avoid blocking event loop
-                    # This is crucial: CPU-bound work must run in a separate thread/process
-                    loop = asyncio.get_event_loop()
-                    result = await loop.run_in_executor(
-                        self.executor,
-                        self._process_pdf_sync,
-                        task_data["pdf_path"],
-                        task_id,
-                        task_data["source_url"],
-                        task_data["source_filename"],
-                        task_data["max_batch_size"]
+                loop = asyncio.get_running_loop()
+                args = (
+                    task_data["pdf_path"],
+                    task_id,
+                    task_data["source_url"],
+                    task_data["source_filename"],
+                    task_data["max_batch_size"]
+                )
+                if self.inference_processes:
+                    result = await loop.run_in_executor(self.executor, _process_pdf_in_worker, *args)
+                else:
+                    # Render on the CPU pool up to one batch ahead of inference on the GPU pool
+                    pages = _PageQueue(task_data["max_batch_size"])
+                    rasterizing = loop.run_in_executor(
+                        self.cpu_executor, pages.produce, self._rasterize_pdf, task_data["pdf_path"]
                     )
-                    
-                    # Upload results to blob storage if available
-                    output_url = None
-                    if self._processing_service.blob_manager:
-                        output_blob_name = f"processed_{task_id}.json"
-                        output_url = await self._processing_service.blob_manager.upload_json_to_blob(
-                            result.dict(), task_data["output_container"], output_blob_name
-                        )
-                    
-                    # Update task with success
-                    task_info.status = TaskStatus.COMPLETED
-                    task_info.completed_at = datetime.now().isoformat()
-                    task_info.result = {
-                        "output_url": output_url,
-                        "total_pages": result.total_pages,
-                        "processing_time": result.processing_time,
-                        "timestamp": result.timestamp
-                    }
-                    
-                    self._tasks_processed += 1
-                    logger.info(f"Task {task_id} completed successfully ({self._tasks_processed} total)")
-                    
-                except Exception as e:
-                    # Update task with error
-                    task_info.status = TaskStatus.FAILED
-                    task_info.completed_at = datetime.now().isoformat()
-                    task_info.error = str(e)
-                    
-                    self._tasks_processed += 1
-                    logger.error(f"Task {task_id} failed: {str(e)}", exc_info=True)
+                    result = await loop.run_in_executor(self.executor, self._process_pdf_sync, *args, pages)
                 
-                finally:
-                    # Clean up temporary file if it exists
-                    if task_data["pdf_path"]:
-                        self._processing_service.file_manager.cleanup_temp_file(
-                            task_data["pdf_path"]
-                        )
-                
-                # Mark task as done in queue
-                self.processing_queue.task_done()
-                
-            except asyncio.CancelledError:
-                logger.info("Worker task cancelled")
-                self._worker_running = False
-                break
             except Exception as e:
-                logger.error(f"Unexpected error in worker: {str(e)}", exc_info=True)
-                # Continue processing other tasks
-                continue
+                self._fail_task(task_info, e)
+                return
+            
+            finally:
+                if pages is not None:
+                    pages.close()
+                if rasterizing is not None:
+                    # The renderer must be done with the PDF before it is deleted
+                    await asyncio.gather(rasterizing, return_exceptions=True)
+                # The source PDF is not needed past inference
+                self._cleanup_task_file(task_data)
+        
+        await self._finalize_task(task_info, task_data, result)
+    
+    async def _finalize_task(self, task_info: TaskInfo, task_data: Dict, result):
+        """Upload a task's results and mark it completed
+        
+        Args:
+            task_info: Task to update
+            task_data: Parameters captured by submit_task
+            result: ProcessingResult from inference
+        """
+        task_id = task_info.task_id
+        try:
+            # Upload results to blob storage if available
+            output_url = None
+            if self._processing_service.blob_manager:
+                output_blob_name = f"processed_{task_id}.json"
+                output_url = await self._processing_service.blob_manager.upload_json_bytes_to_blob(
+                    result.model_dump_json().encode(), task_data["output_container"], output_blob_name
+                )
+            
+            # Update task with success
+            task_info.completed_at = time.time()
+            task_info.result = {
+                "output_url": output_url,
+                "total_pages": result.total_pages,
+                "processing_time": result.processing_time,
+                "timestamp": result.timestamp
+            }
+            
+            self._tasks_processed += 1
+            self._set_status(task_info, TaskStatus.COMPLETED)
+            logger.info("Task %s completed successfully (%d total)", task_id, self._tasks_processed)
+            
+        except Exception as e:
+            self._fail_task(task_info, e)
+    
+    def _fail_task(self, task_info: TaskInfo, error: Exception):
+        """Mark a task as failed
+        
+        Args:
+            task_info: Task to update
+            error: Exception that caused the failure
+        """
+        task_info.completed_at = time.time()
+        task_info.error = str(error)
+        
+        self._tasks_processed += 1
+        self._set_status(task_info, TaskStatus.FAILED)
+        logger.error("Task %s failed: %s", task_info.task_id, error, exc_info=error)
+    
+    def _cleanup_task_file(self, task_data: Dict):
+        """Clean up a task's temporary PDF file if it exists"""
+        if task_data["pdf_path"]:
+            self._processing_service.file_manager.cleanup_temp_file(
+                task_data["pdf_path"]
+            )
+    
+    def _rasterize_pdf(self, pdf_path: str) -> Iterator[Image.Image]:
+        """Lazily render the pages of a PDF for the inference stage"""
+        return self._processing_service.file_manager.convert_pdf_to_images(pdf_path)
     
     def _process_pdf_sync(
         self,
@@ -270,31 +579,19 @@ class BackgroundTaskManager:
         task_id: str,
         source_url: Optional[str],
         source_filename: Optional[str],
-        max_batch_size: int
+        max_batch_size: int,
+        pages: Optional[Iterable[Image.Image]] = None
     ):
         """Synchronous PDF processing that runs in thread pool
         
         This method runs in a separate thread to avoid blocking the event loop.
         It performs the actual CPU/GPU-bound work.
         """
-        import asyncio
-        
-        # Create a new event loop for this thread
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            # Run the async processing in this thread's event loop
-            result = loop.run_until_complete(
-                self._processing_service._process_pdf_file(
-                    pdf_path=pdf_path,
-                    task_id=task_id,
-                    source_url=source_url,
-                    source_filename=source_filename,
-                    max_batch_size=max_batch_size
-                )
-            )
-            return result
-        finally:
-            loop.close()
-
+        return self._processing_service._process_pdf_file_sync(
+            pdf_path=pdf_path,
+            task_id=task_id,
+            source_url=source_url,
+            source_filename=source_filename,
+            max_batch_size=max_batch_size,
+            pages=pages
+        )
@@ -0,0 +1,182 @@
+"""
+io_uring File Writer
+
+Batches sequential file writes through io_uring when liburing is installed.
+"""
+
+import asyncio
+import errno
+import os
+import platform
+from typing import Dict, Tuple
+
+try:
+    import liburing
+except ImportError:  # Optional, Linux-only dependency
+    liburing = None
+
+# Whether UringWriter can be used on this host
+URING_SUPPORTED = liburing is not None and platform.system() == "Linux"
+
+# Ring size, which also caps the number of writes in flight at once
+RING_ENTRIES = 64
+
+# Bytes that may be queued or in flight before a flush waits for completions
+DEFAULT_MAX_PENDING_BYTES = 32 * 1024 * 1024
+
+
+class UringWriter:
+    """Sequential file writer that overlaps chunk writes with the caller via io_uring
+    
+    Writes are queued as SQEs and submitted in batches of queue_depth
+    without waiting for them; completions are reaped on later flushes.
+    A flush only blocks while more than max_pending_bytes are queued or
+    in flight, so memory stays bounded and the disk keeps writing while
+    the caller reads its next chunks. Blocking work runs off the event
+    loop thread.
+    """
+    
+    def __init__(self, fd: int, queue_depth: int = 8, max_pending_bytes: int = DEFAULT_MAX_PENDING_BYTES):
+        """Set up the ring for an already opened file
+        
+        Args:
+            fd: Writable file descriptor; the writer closes it on close()
+            queue_depth: Number of chunk writes batched per submission
+            max_pending_bytes: Bytes held in queued or unfinished writes before flushes wait
+        """
+        self.queue_depth = min(queue_depth, RING_ENTRIES)
+        self.max_pending_bytes = max_pending_bytes
+        self._ring = liburing.io_uring()
+        self._cqes = liburing.io_uring_cqes()
+        liburing.io_uring_queue_init(RING_ENTRIES, self._ring, 0)
+        self._fd = fd
+        
+        # Pre-register the output fd to avoid per-op fd refcounting
+        try:
+            liburing.io_uring_register_files(self._ring, [self._fd])
+            self._target = 0
+            self._sqe_flags = liburing.IOSQE_FIXED_FILE
+        except Exception:
+            self._target = self._fd
+            self._sqe_flags = 0
+        
+        self._offset = 0
+        self._next_id = 0
+        # (buffer, file offset) of every unfinished write, keyed by SQE user_data;
+        # holding them keeps each buffer alive until the kernel has completed it
+        self._inflight: Dict[int, Tuple[bytes, int]] = {}
+        self._pending_bytes = 0
+        self._unsubmitted = 0
+        # Submitted writes whose completions have not been reaped yet
+        self._in_kernel = 0
+    
+    async def __aenter__(self) -> "UringWriter":
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    def queue(self, chunk: bytes) -> bool:
+        """Queue a chunk for writing at the current offset without submitting
+        
+        The chunk must not be modified until it has been written.
+        
+        Returns:
+            True once the caller should flush
+        """
+        self._prep_write(chunk, self._offset)
+        self._offset += len(chunk)
+        return (
+            self._unsubmitted >= self.queue_depth
+            or self._pending_bytes >= self.max_pending_bytes
+            or len(self._inflight) >= RING_ENTRIES
+        )
+    
+    def _prep_write(self, chunk: bytes, offset: int):
+        sqe = liburing.io_uring_get_sqe(self._ring)
+        liburing.io_uring_prep_write(sqe, self._target, chunk, len(chunk), offset)
+        if self._sqe_flags:
+            liburing.io_uring_sqe_set_flags(sqe, self._sqe_flags)
+        liburing.io_uring_sqe_set_data64(sqe, self._next_id)
+        self._inflight[self._next_id] = (chunk, offset)
+        self._next_id += 1
+        self._pending_bytes += len(chunk)
+        self._unsubmitted += 1
+    
+    async def write(self, chunk: bytes):
+        """Queue a chunk for writing at the current offset"""
+        if self.queue(chunk):
+            await self.flush()
+    
+    async def flush(self):
+        """Submit queued writes, reaping finished ones and waiting only while over budget"""
+        if self._inflight:
+            await asyncio.to_thread(self.flush_sync)
+    
+    def flush_sync(self):
+        """Blocking variant of flush() for callers already off the event loop"""
+        self._submit()
+        for _ in range(liburing.io_uring_cq_ready(self._ring)):
+            self._reap_one()
+        self._submit()
+        while self._in_kernel and (
+            self._pending_bytes > self.max_pending_bytes or len(self._inflight) >= RING_ENTRIES
+        ):
+            self._reap_one()
+            self._submit()
+    
+    def _drain(self):
+        """Submit everything and block until every write has completed"""
+        self._submit()
+        while self._in_kernel:
+            self._reap_one()
+            self._submit()
+    
+    def _submit(self):
+        if self._unsubmitted:
+            liburing.io_uring_submit(self._ring)
+            self._in_kernel += self._unsubmitted
+            self._unsubmitted = 0
+    
+    def _reap_one(self):
+        """Wait for one completion, requeueing the remainder of a short write"""
+        liburing.io_uring_wait_cqe(self._ring, self._cqes)
+        cqe = self._cqes[0]
+        res = cqe.res
+        chunk, offset = self._inflight.pop(liburing.io_uring_cqe_get_data64(cqe))
+        liburing.io_uring_cqe_seen(self._ring, cqe)
+        self._in_kernel -= 1
+        self._pending_bytes -= len(chunk)
+        if res < 0:
+            raise OSError(-res, os.strerror(-res))
+        if res < len(chunk):
+            if res == 0:
+                raise OSError(errno.EIO, "io_uring write made no progress")
+            self._prep_write(chunk[res:], offset + res)
+    
+    async def close(self):
+        """Drain outstanding writes and release the ring and file"""
+        if self._inflight:
+            await asyncio.to_thread(self.close_sync)
+        else:
+            self._release()
+    
+    def close_sync(self):
+        """Blocking variant of close() for callers already off the event loop"""
+        try:
+            self._drain()
+        finally:
+            self._release()
+    
+    def _release(self):
+        try:
+            # After a failed write others may still be running; their buffers
+            # must stay alive until the kernel is done with them
+            while self._in_kernel:
+                liburing.io_uring_wait_cqe(self._ring, self._cqes)
+                liburing.io_uring_cqe_seen(self._ring, self._cqes[0])
+                self._in_kernel -= 1
+            self._inflight.clear()
+        finally:
+            liburing.io_uring_queue_exit(self._ring)
+            os.close(self._fd)
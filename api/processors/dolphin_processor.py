@@ -29,13 +29,20 @@ class DolphinProcessor:
     def _load_model(self):
         """Load the Dolphin model using the existing DOLPHIN class"""
         try:
-            logger.info(f"Loading Dolphin model from {self.model_path}")
+            logger.info("Loading Dolphin model from %s", self.model_path)
             self.model = DOLPHIN(self.model_path)
-            logger.info(f"Model loaded successfully")
+            # The device never changes after loading, so snapshot it once
+            self.device_str = str(self.model.device)
+            self._device_info = {
+                "device": self.device_str,
+                "cuda_available": "cuda" in self.device_str,
+                "model_path": self.model_path
+            }
+            logger.info("Model loaded successfully")
             
         except Exception as e:
-            logger.error(f"Failed to load model: {str(e)}")
-            raise RuntimeError(f"Failed to load Dolphin model: {str(e)}")
+            logger.exception("Failed to load model from %s", self.model_path)
+            raise RuntimeError(f"Failed to load Dolphin model: {str(e)}") from e
     
     def chat(self, prompt: str, image: Image.Image) -> str:
         """Process an image with the given prompt using the existing DOLPHIN chat method
@@ -49,8 +56,8 @@ class DolphinProcessor:
         """
         try:
             return self.model.chat(prompt, image)
-        except Exception as e:
-            logger.error(f"Error in chat processing: {str(e)}")
+        except RuntimeError:
+            logger.exception("Error in chat processing")
             raise
     
     def chat_batch(self, prompts: List[str], images: List[Image.Image]) -> List[str]:
@@ -65,18 +72,27 @@ class DolphinProcessor:
         """
         try:
             return self.model.chat(prompts, images)
-        except Exception as e:
-            logger.error(f"Error in batch chat processing: {str(e)}")
+        except RuntimeError:
+            logger.exception("Error in batch chat processing")
             raise
     
+    def warmup(self):
+        """Run one tiny forward pass so the first real request skips lazy
+        CUDA context, kernel and image-processor initialization
+        """
+        try:
+            self.model.chat("Parse the reading order of this document.", Image.new("RGB", (32, 32), "white"))
+            logger.info("Model warmup completed")
+        except Exception:
+            # Best effort: a failed warmup only means the first request pays the start-up cost
+            logger.warning("Model warmup failed", exc_info=True)
+    
     def get_device_info(self) -> dict:
         """Get information about the current device
         
+        The information is captured once when the model loads.
+        
         Returns:
             Dictionary with device information
         """
-        return {
-            "device": self.model.device,
-            "cuda_available": hasattr(self.model, 'device') and 'cuda' in str(self.model.device),
-            "model_path": self.model_path
-        }
+        return dict(self._device_info)
@@ -5,17 +5,23 @@ Handles document parsing logic using existing Dolphin module functions.
 """
 
 import logging
-from typing import Dict, List
+import threading
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Tuple
 
+import numpy as np
 from PIL import Image
 
 
-from Dolphin.utils.utils import prepare_image
+from Dolphin.utils.utils import ImageDimensions
 from Dolphin.demo_page_hf import process_elements
 from ..processors import DolphinProcessor
 
 logger = logging.getLogger(__name__)
 
+# Stage 1 prompt for page-level layout and reading order
+LAYOUT_PROMPT = "Parse the reading order of this document."
+
 
 class DocumentParser:
     """Handles document parsing operations using existing Dolphin functions"""
@@ -27,6 +33,8 @@ class DocumentParser:
             processor: Dolphin processor instance
         """
         self.processor = processor
+        # Per-thread padded page buffers, reused across pages of the same size
+        self._buffers = threading.local()
     
     def process_single_image(self, image: Image.Image, max_batch_size: int = 16) -> List[Dict]:
         """Process a single image for document parsing using existing Dolphin functions
@@ -40,22 +48,113 @@ class DocumentParser:
         """
         try:
             # Stage 1: Page-level layout and reading order parsing
-            layout_output = self.processor.chat("Parse the reading order of this document.", image)
+            layout_output = self.processor.chat(LAYOUT_PROMPT, image)
             
             # Stage 2: Element-level content parsing using existing Dolphin functions
-            padded_image, dims = prepare_image(image)
-            recognition_results = process_elements(
-                layout_output, 
-                padded_image, 
-                dims, 
-                self.processor.model, 
-                max_batch_size, 
-                None,  # save_dir - not needed for API
-                None   # image_name - not needed for API
-            )
-            
-            return recognition_results
-            
-        except Exception as e:
-            logger.error(f"Error processing single image: {str(e)}")
+            return self._process_layout(image, layout_output, max_batch_size)
+            
+        except (RuntimeError, ValueError):
+            # RuntimeError covers torch failures, including CUDA out-of-memory
+            logger.exception("Error processing single image")
             raise
+    
+    def process_image_batch(self, images: List[Image.Image], max_batch_size: int = 16) -> List[List[Dict]]:
+        """Process several page images, running Stage 1 for all of them in one batch
+        
+        Args:
+            images: PIL Images to process, one per page
+            max_batch_size: Maximum batch size for processing
+            
+        Returns:
+            List of parsed elements for each image, in input order
+        """
+        if not images:
+            return []
+        if len(images) == 1:
+            return [self.process_single_image(images[0], max_batch_size)]
+        
+        try:
+            # Stage 1: one batched forward for the reading order of every page
+            layout_outputs = self.processor.chat_batch([LAYOUT_PROMPT] * len(images), images)
+            
+            # Stage 2: element crops are decoded per page in max_batch_size batches
+            return [
+                self._process_layout(image, layout_output, max_batch_size)
+                for image, layout_output in zip(images, layout_outputs)
+            ]
+            
+        except (RuntimeError, ValueError):
+            logger.exception("Error processing image batch of %d pages", len(images))
+            raise
+    
+    def process_pages_batched(self, pages: Iterable[Image.Image], max_batch_size: int = 16) -> Iterator[List[Dict]]:
+        """Process a document's pages in groups of max_batch_size
+        
+        Pages are pulled from the iterable one group at a time, so a lazy page
+        renderer only ever has one group in memory. Each group's pages are
+        closed once parsed.
+        
+        Args:
+            pages: PIL Images of the pages, in order
+            max_batch_size: Maximum batch size for processing
+            
+        Yields:
+            List of parsed elements for each page, in page order
+        """
+        page_iter = iter(pages)
+        pages_done = 0
+        while batch := list(islice(page_iter, max_batch_size)):
+            logger.info("Processing pages %d-%d", pages_done + 1, pages_done + len(batch))
+            batch_results = self.process_image_batch(batch, max_batch_size)
+            
+            # Release the rendered pages before the next batch is rendered
+            for image in batch:
+                image.close()
+            del batch
+            
+            pages_done += len(batch_results)
+            yield from batch_results
+    
+    def _process_layout(self, image: Image.Image, layout_output: str, max_batch_size: int) -> List[Dict]:
+        """Run Stage 2 element parsing for a page whose layout is already known"""
+        padded_image, dims = self._prepare_image(image)
+        return process_elements(
+            layout_output, 
+            padded_image, 
+            dims, 
+            self.processor.model, 
+            max_batch_size, 
+            None,  # save_dir - not needed for API
+            None   # image_name - not needed for API
+        )
+    
+    def _prepare_image(self, image: Image.Image) -> Tuple[np.ndarray, ImageDimensions]:
+        """Pad a page to a square BGR array, as Dolphin's prepare_image does
+        
+        The page is centered on a black square in a buffer reused across pages,
+        and the RGB to BGR swap happens in the same copy, so no intermediate
+        arrays are allocated per page. The buffer is overwritten by the next
+        page prepared on the same thread.
+        
+        Args:
+            image: PIL Image of the page
+            
+        Returns:
+            Tuple of (padded BGR image, image dimensions)
+        """
+        rgb = np.asarray(image if image.mode == "RGB" else image.convert("RGB"))
+        h, w = rgb.shape[:2]
+        size = max(h, w)
+        
+        buffer = getattr(self._buffers, "padded", None)
+        if buffer is None or buffer.shape[0] != size:
+            buffer = np.empty((size, size, 3), dtype=np.uint8)
+            self._buffers.padded = buffer
+        
+        top = (size - h) // 2
+        left = (size - w) // 2
+        buffer.fill(0)
+        buffer[top:top + h, left:left + w] = rgb[..., ::-1]
+        
+        dims = ImageDimensions(original_w=w, original_h=h, padded_w=size, padded_h=size)
+        return buffer, dims
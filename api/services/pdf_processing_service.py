@@ -4,13 +4,18 @@ PDF Processing Service
 Main service class that orchestrates the document processing workflow.
 """
 
+import asyncio
 import logging
 import os
+import time
 from datetime import datetime
-from typing import List, Optional
+from typing import Iterable, Optional, Tuple
+from uuid import uuid4
 
 from fastapi import HTTPException, UploadFile, status
+from PIL import Image
 
+from ..config import settings
 from ..managers import BackgroundTaskManager, BlobStorageManager, FileManager
 from ..models import ProcessingResult, ProcessingResponse
 from ..processors import DolphinProcessor
@@ -18,35 +23,80 @@ from .document_parser import DocumentParser
 
 logger = logging.getLogger(__name__)
 
+# How long get_service_info results are reused
+SERVICE_INFO_TTL_SECONDS = 5.0
+
 
 class PDFProcessingService:
     """Main service for PDF processing operations"""
     
     def __init__(
         self,
-        processor: DolphinProcessor,
+        processor: Optional[DolphinProcessor],
         blob_manager: Optional[BlobStorageManager] = None,
         file_manager: Optional[FileManager] = None,
-        task_manager: Optional[BackgroundTaskManager] = None
+        task_manager: Optional[BackgroundTaskManager] = None,
+        max_concurrent_inference: int = 1
     ):
         """Initialize the PDF processing service
         
         Args:
-            processor: Dolphin processor instance
+            processor: Dolphin processor instance, or None while the model is loading
             blob_manager: Blob storage manager instance
             file_manager: File manager instance
             task_manager: Background task manager instance
+            max_concurrent_inference: Maximum number of synchronous requests
+                running the model at the same time
         """
-        self.processor = processor
-        self.parser = DocumentParser(processor)
+        self.processor = None
+        self.parser = None
+        # Device details are fixed once the model is loaded; captured in set_processor
+        self._processor_info: Optional[dict] = None
+        self._service_info_cache: Optional[Tuple[float, dict]] = None
+        self.model_loading = True
+        self.model_load_error: Optional[BaseException] = None
+        if processor is not None:
+            self.set_processor(processor)
         self.blob_manager = blob_manager
         self.file_manager = file_manager or FileManager()
         self.task_manager = task_manager
+        # Bounds synchronous requests on the model, which now run off the event loop
+        self._inference_slots = asyncio.Semaphore(max_concurrent_inference)
         
         # Set this service in the task manager
         if self.task_manager:
             self.task_manager.set_processing_service(self)
     
+    def set_processor(self, processor: DolphinProcessor):
+        """Attach a loaded Dolphin processor
+        
+        Args:
+            processor: Dolphin processor instance
+        """
+        self.processor = processor
+        self.parser = DocumentParser(processor)
+        self._processor_info = processor.get_device_info()
+        self.model_loading = False
+        self._service_info_cache = None
+    
+    def set_model_load_error(self, error: BaseException):
+        """Record that the model failed to load
+        
+        Args:
+            error: Exception raised while loading the model
+        """
+        self.model_load_error = error
+        self.model_loading = False
+        self._service_info_cache = None
+    
+    def _require_model(self):
+        """Raise 503 if the model is not ready to serve requests"""
+        if self.processor is None:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Model failed to load" if self.model_load_error else "Model is still loading"
+            )
+    
     async def process_pdf_from_blob(
         self,
         pdf_url: str,
@@ -68,6 +118,8 @@ class PDFProcessingService:
         Raises:
             HTTPException: If processing fails
         """
+        self._require_model()
+        
         if not self.blob_manager:
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -77,10 +129,10 @@ class PDFProcessingService:
         task_id = self._generate_task_id()
         
         try:
-            logger.info(f"Submitting PDF processing task {task_id}")
+            logger.info("Submitting PDF processing task %s", task_id)
             
             # Download PDF from blob storage
-            pdf_path = await self.blob_manager.download_blob_to_temp(pdf_url)
+            pdf_path = await self.blob_manager.download_blob_to_temp_streaming(pdf_url)
             
             if async_processing and self.task_manager:
                 # Submit to background processing
@@ -101,7 +153,8 @@ class PDFProcessingService:
                 )
             else:
                 # Synchronous processing (original behavior)
-                start_time = datetime.now()
+                # Monotonic clock, so wall-clock adjustments can't skew the duration
+                start_time = time.perf_counter()
                 
                 try:
                     # Process the PDF
@@ -111,13 +164,13 @@ class PDFProcessingService:
                     
                     # Upload results to blob storage
                     output_blob_name = f"processed_{task_id}.json"
-                    output_url = await self.blob_manager.upload_json_to_blob(
-                        result.dict(), output_container, output_blob_name
+                    output_url = await self.blob_manager.upload_json_bytes_to_blob(
+                        result.model_dump_json().encode(), output_container, output_blob_name
                     )
                     
-                    processing_time = (datetime.now() - start_time).total_seconds()
+                    processing_time = time.perf_counter() - start_time
                     
-                    logger.info(f"Completed PDF processing task {task_id} in {processing_time:.2f} seconds")
+                    logger.info("Completed PDF processing task %s in %.2f seconds", task_id, processing_time)
                     
                     return ProcessingResponse(
                         task_id=task_id,
@@ -134,10 +187,10 @@ class PDFProcessingService:
         except HTTPException:
             raise
         except Exception as e:
-            logger.error(f"Error processing PDF task {task_id}: {str(e)}")
+            logger.exception("Error processing PDF task %s", task_id)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to process PDF: {str(e)}"
+                detail=self.failure_detail(e)
             )
     
     async def process_pdf_upload(
@@ -161,6 +214,8 @@ class PDFProcessingService:
         Raises:
             HTTPException: If processing fails
         """
+        self._require_model()
+        
         task_id = self._generate_task_id()
         
         try:
@@ -170,17 +225,19 @@ class PDFProcessingService:
                     detail="Only PDF files are supported"
                 )
             
-            logger.info(f"Submitting PDF upload processing task {task_id}")
+            # Reject non-PDFs from the first bytes, before copying the upload to disk
+            if not await self.file_manager.has_pdf_header(file):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid PDF file"
+                )
             
-            # Read file content
-            file_content = await file.read()
+            logger.info("Submitting PDF upload processing task %s", task_id)
             
-            # Save to temporary file
-            pdf_path = self.file_manager.save_upload_to_temp(
-                file_content, file.filename
-            )
+            # Stream file content to a temporary file
+            pdf_path, _ = await self.file_manager.stream_upload_to_temp(file)
             
-            # Validate PDF
+            # Structural check (page count, encryption) on the saved copy
             if not self.file_manager.validate_pdf_file(pdf_path):
                 self.file_manager.cleanup_temp_file(pdf_path)
                 raise HTTPException(
@@ -207,7 +264,8 @@ class PDFProcessingService:
                 )
             else:
                 # Synchronous processing (original behavior)
-                start_time = datetime.now()
+                # Monotonic clock, so wall-clock adjustments can't skew the duration
+                start_time = time.perf_counter()
                 
                 try:
                     # Process the PDF
@@ -219,13 +277,13 @@ class PDFProcessingService:
                     output_url = None
                     if self.blob_manager:
                         output_blob_name = f"processed_{task_id}.json"
-                        output_url = await self.blob_manager.upload_json_to_blob(
-                            result.dict(), output_container, output_blob_name
+                        output_url = await self.blob_manager.upload_json_bytes_to_blob(
+                            result.model_dump_json().encode(), output_container, output_blob_name
                         )
                     
-                    processing_time = (datetime.now() - start_time).total_seconds()
+                    processing_time = time.perf_counter() - start_time
                     
-                    logger.info(f"Completed PDF upload processing task {task_id} in {processing_time:.2f} seconds")
+                    logger.info("Completed PDF upload processing task %s in %.2f seconds", task_id, processing_time)
                     
                     return ProcessingResponse(
                         task_id=task_id,
@@ -242,10 +300,10 @@ class PDFProcessingService:
         except HTTPException:
             raise
         except Exception as e:
-            logger.error(f"Error processing PDF upload task {task_id}: {str(e)}")
+            logger.exception("Error processing PDF upload task %s", task_id)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to process PDF: {str(e)}"
+                detail=self.failure_detail(e)
             )
     
     async def _process_pdf_file(
@@ -258,43 +316,70 @@ class PDFProcessingService:
     ) -> ProcessingResult:
         """Process a PDF file and return results
         
+        Runs _process_pdf_file_sync on a worker thread so the event loop keeps
+        serving other requests while the model is busy.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            task_id: Unique task identifier
+            source_url: Source URL if from blob storage
+            source_filename: Source filename if from upload
+            max_batch_size: Maximum batch size for processing
+            
+        Returns:
+            ProcessingResult with parsed data
+        """
+        async with self._inference_slots:
+            return await asyncio.to_thread(
+                self._process_pdf_file_sync,
+                pdf_path, task_id, source_url, source_filename, max_batch_size
+            )
+    
+    def _process_pdf_file_sync(
+        self,
+        pdf_path: str,
+        task_id: str,
+        source_url: Optional[str],
+        source_filename: Optional[str],
+        max_batch_size: int,
+        pages: Optional[Iterable[Image.Image]] = None
+    ) -> ProcessingResult:
+        """Process a PDF file and return results, blocking the calling thread
+        
         Args:
             pdf_path: Path to the PDF file
             task_id: Unique task identifier
             source_url: Source URL if from blob storage
             source_filename: Source filename if from upload
             max_batch_size: Maximum batch size for processing
+            pages: Pages of pdf_path rendered by the caller, if available
             
         Returns:
             ProcessingResult with parsed data
         """
         try:
-            # Convert PDF to images
-            images = self.file_manager.convert_pdf_to_images(pdf_path)
-            if not images:
+            # Render pages lazily unless the caller supplies them; either way
+            # each page is released as soon as its batch has been parsed
+            if pages is None:
+                pages = self.file_manager.convert_pdf_to_images(pdf_path)
+            
+            # Process pages in batches as they are rendered
+            all_results = [
+                {
+                    "page_number": page_number,
+                    "elements": recognition_results
+                }
+                for page_number, recognition_results in enumerate(
+                    self.parser.process_pages_batched(pages, max_batch_size), start=1
+                )
+            ]
+            
+            if not all_results:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Failed to convert PDF to images"
                 )
             
-            all_results = []
-            
-            # Process each page
-            for page_idx, pil_image in enumerate(images):
-                logger.info(f"Processing page {page_idx + 1}/{len(images)}")
-                
-                # Process this page
-                recognition_results = self.parser.process_single_image(
-                    pil_image, max_batch_size
-                )
-                
-                # Add page information to results
-                page_results = {
-                    "page_number": page_idx + 1,
-                    "elements": recognition_results
-                }
-                all_results.append(page_results)
-            
             # Prepare combined results
             processing_time = 0.0  # This will be set by the calling method
             combined_results = ProcessingResult(
@@ -309,30 +394,59 @@ class PDFProcessingService:
             
             return combined_results
             
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Error processing PDF file: {str(e)}")
+        except (RuntimeError, OSError, ValueError):
+            logger.exception("Error processing PDF file: %s", pdf_path)
             raise
     
+    @staticmethod
+    def failure_detail(error: Exception, message: str = "Failed to process PDF") -> str:
+        """Build the client-facing message for an unexpected error
+        
+        The exception text is only exposed when debugging; it is always logged.
+        
+        Args:
+            error: The exception that aborted the request
+            message: Generic description of what failed
+            
+        Returns:
+            Error detail for the HTTP response
+        """
+        if settings.LOG_LEVEL == "DEBUG":
+            return f"{message}: {error}"
+        return message
+    
     def _generate_task_id(self) -> str:
         """Generate a unique task ID
         
         Returns:
             Unique task identifier
         """
-        import uuid
-        return str(uuid.uuid4())
+        return str(uuid4())
     
-    def get_service_info(self) -> dict:
+    def get_service_info(self, ttl_seconds: float = SERVICE_INFO_TTL_SECONDS, force_refresh: bool = False) -> dict:
         """Get information about the service
         
+        The result is cached briefly since it only changes when the model
+        finishes loading, which clears the cache.
+        
+        Args:
+            ttl_seconds: How long a cached result may be served
+            force_refresh: Bypass and rebuild the cache
+        
         Returns:
             Dictionary with service information
         """
-        return {
-            "processor_info": self.processor.get_device_info(),
+        cached = self._service_info_cache
+        if not force_refresh and cached is not None and time.monotonic() - cached[0] < ttl_seconds:
+            return dict(cached[1])
+        
+        service_info = {
+            "processor_info": dict(self._processor_info) if self._processor_info else None,
+            "model_loading": self.model_loading,
             "blob_storage_available": self.blob_manager is not None,
             "blob_storage_info": self.blob_manager.get_storage_info() if self.blob_manager else None,
             "file_manager_temp_dir": self.file_manager.temp_dir
         }
+        # Stamp after the lookups so slow introspection doesn't shorten the TTL
+        self._service_info_cache = (time.monotonic(), service_info)
+        return dict(service_info)
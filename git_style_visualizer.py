@@ -4,282 +4,295 @@ Git-style Graph Visualization for Document Hierarchy
 Creates a visual tree representation similar to git history with branching lines.
 """
 
+import io
 import json
-from typing import Dict, List, Any, Optional, Tuple
-from dataclasses import dataclass
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Union
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # Optional; parses several times faster than json
+    _json_loads = json.loads
 
-@dataclass
-class VisualizationNode:
-    """Node for visualization with git-style branching info."""
-    id: str
-    label: str
-    text: str
-    level: int
-    page: int
-    children: List['VisualizationNode']
-    content_elements: List['VisualizationNode']
-    is_merged: bool = False
-    merged_count: int = 0
+STRUCTURAL_LABELS = frozenset({'title', 'document', 'sec'})
 
+# Icon tables are shared by every call, so build them once per process
+ICON_MAP = {
+    'title': '📖',
+    'document': '📚', 
+    'sec': '📑',
+    'sub_sec': '📝',
+    'sub_sub_sec': '•',
+    'para': '¶',
+    'figure': '🖼️',
+    'table': '📊',
+    'list_group': '📋',
+    'author': '👤',
+    'fnote': '📌',
+    'foot': '👇'
+}
+SUB_SECTION_ICONS = ('📝', '•', '◦', '‣', '▪', '▫')
 
-def create_git_style_visualization(hierarchy_file: str) -> str:
+FLOW_ICON_MAP = {
+    'title': '📖',
+    'sec': '📑',
+    'sub_sec': '📝',
+    'sub_sub_sec': '•',
+    'para': '¶',
+    'figure': '🖼️',
+    'table': '📊',
+    'list_group': '📋',
+}
+FLOW_SUB_SECTION_ICONS = ('📝', '•', '◦', '‣')
+
+
+def create_git_style_visualization(hierarchy: Union[str, Dict[str, Any]]) -> str:
     """Create a git-style branching visualization of the document hierarchy."""
     
-    with open(hierarchy_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = _load_hierarchy(hierarchy)
     
-    # Convert JSON to visualization nodes
-    root = convert_to_viz_node(data)
+    # Walk the parsed JSON directly; no intermediate node tree is built
+    buf = io.StringIO()
+    generate_git_lines(data, _line_emitter(buf.write), "", True, is_root=True)
     
-    # Generate the git-style visualization
-    lines = []
-    generate_git_lines(root, lines, [], True, is_root=True)
-    
-    return '\n'.join(lines)
+    return buf.getvalue()
+
+
+@lru_cache(maxsize=None)
+def _is_structural(label: str) -> bool:
+    """Whether a label is a structural (title/section) node; cached per label."""
+    return label in STRUCTURAL_LABELS or label.startswith('sub_')
+
+
+def _load_hierarchy(hierarchy: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Return the parsed hierarchy, reading the file if given a path.
+    
+    Parses are reused while the file is unchanged.
+    """
+    if isinstance(hierarchy, dict):
+        return hierarchy
+    return _parse_hierarchy(hierarchy, os.stat(hierarchy).st_mtime_ns)
 
 
-def convert_to_viz_node(json_node: Dict[str, Any]) -> VisualizationNode:
-    """Convert JSON node to visualization node."""
-    children = [convert_to_viz_node(child) for child in json_node.get('children', [])]
-    content = [convert_to_viz_node(content) for content in json_node.get('content_elements', [])]
+@lru_cache(maxsize=1)
+def _parse_hierarchy(hierarchy_file: str, mtime_ns: int) -> Dict[str, Any]:
+    """Parse the hierarchy file; mtime_ns is only part of the cache key."""
+    return _json_loads(Path(hierarchy_file).read_bytes())
+
+
+def _line_emitter(write: Callable[[str], None]) -> Callable[[str], None]:
+    """Wrap a writer so emitted lines are newline-separated, like '\\n'.join."""
+    separator = ''
     
-    return VisualizationNode(
-        id=json_node.get('id', ''),
-        label=json_node.get('label', ''),
-        text=json_node.get('text', ''),
-        level=json_node.get('level', -1),
-        page=json_node.get('page', 0),
-        children=children,
-        content_elements=content,
-        is_merged=json_node.get('is_merged', False),
-        merged_count=len(json_node.get('merged_elements', []))
-    )
-
-
-def generate_git_lines(node: VisualizationNode, lines: List[str], prefix: List[str], 
+    def emit(line: str):
+        nonlocal separator
+        write(separator)
+        write(line)
+        separator = '\n'
+    
+    return emit
+
+
+def _display_text(text: str, width: int) -> str:
+    """Clamp text to width characters, marking truncation with '...'."""
+    # Short texts (the common case) are returned as-is without slicing
+    if len(text) <= width:
+        return text
+    return text[:width] + '...'
+
+
+def _node_icon(label: str, icon_map: Dict[str, str], sub_icons: tuple) -> str:
+    """Pick the icon for a node label, handling nested sub-section labels."""
+    if label.startswith('sub_'):
+        sub_count = label.count('sub_')
+        return sub_icons[min(sub_count - 1, len(sub_icons) - 1)]
+    return icon_map.get(label, '?')
+
+
+def generate_git_lines(node: Dict[str, Any], emit: Callable[[str], None], prefix_str: str, 
                       is_last: bool, is_root: bool = False, show_content: bool = True):
     """Generate git-style lines with branching."""
+    get = node.get
+    label = get('label', '')
+    page = get('page', 0)
+    children = get('children', ())
+    content_elements = get('content_elements', ())
     
-    # Determine the icon and styling
-    icon_map = {
-        'title': '📖',
-        'document': '📚', 
-        'sec': '📑',
-        'sub_sec': '📝',
-        'sub_sub_sec': '•',
-        'para': '¶',
-        'figure': '🖼️',
-        'table': '📊',
-        'list_group': '📋',
-        'author': '👤',
-        'fnote': '📌',
-        'foot': '👇'
-    }
-    
-    # Handle dynamic sub-section icons
-    if node.label.startswith('sub_'):
-        sub_count = node.label.count('sub_')
-        icons = ['📝', '•', '◦', '‣', '▪', '▫']
-        icon = icons[min(sub_count - 1, len(icons) - 1)]
-    else:
-        icon = icon_map.get(node.label, '?')
+    icon = _node_icon(label, ICON_MAP, SUB_SECTION_ICONS)
     
     # Create the current line
     if is_root:
         branch_chars = ""
     else:
-        branch_chars = ''.join(prefix)
-        if is_last:
-            branch_chars += "└─ "
-        else:
-            branch_chars += "├─ "
+        branch_chars = prefix_str + ("└─ " if is_last else "├─ ")
     
     # Format node text
-    text = node.text[:60] + ('...' if len(node.text) > 60 else '')
-    merge_info = f" [MERGED×{node.merged_count}]" if node.is_merged else ""
-    page_info = f" (p.{node.page})" if node.page > 0 else ""
+    text = _display_text(get('text', ''), 60)
+    merge_info = f" [MERGED×{len(get('merged_elements', ()))}]" if get('is_merged', False) else ""
+    page_info = f" (p.{page})" if page > 0 else ""
     
     # Add the line
-    if node.label in ['title', 'document', 'sec'] or node.label.startswith('sub_'):
+    if _is_structural(label):
         # Structural nodes in bold/highlighted style
         line = f"{branch_chars}{icon} {text}{page_info}{merge_info}"
-        lines.append(line)
+        emit(line)
     else:
         # Content nodes in lighter style
         line = f"{branch_chars}  {icon} {text}{merge_info}"
-        lines.append(line)
+        emit(line)
     
     # Process children (structural elements)
-    total_children = len(node.children)
-    for i, child in enumerate(node.children):
-        is_child_last = (i == total_children - 1) and (not show_content or len(node.content_elements) == 0)
-        
-        # Update prefix for child
-        new_prefix = prefix.copy()
-        if not is_root:
-            if is_last:
-                new_prefix.append("   ")  # Empty space under last item
-            else:
-                new_prefix.append("│  ")  # Continuation line
-        
-        generate_git_lines(child, lines, new_prefix, is_child_last)
+    # Prefix strings only ever grow by one 3-char segment per level
+    if is_root:
+        child_prefix = prefix_str
+    else:
+        child_prefix = prefix_str + ("   " if is_last else "│  ")
+    
+    total_children = len(children)
+    for i, child in enumerate(children):
+        is_child_last = (i == total_children - 1) and (not show_content or len(content_elements) == 0)
+        generate_git_lines(child, emit, child_prefix, is_child_last)
     
     # Process content elements (leaf nodes) - but limit them to avoid clutter
-    if show_content and node.content_elements:
-        content_to_show = node.content_elements[:8]  # Limit to first 8 content elements
+    if show_content and content_elements:
+        content_to_show = content_elements[:8]  # Limit to first 8 content elements
         total_content = len(content_to_show)
         
+        # Prefix for content
+        if is_root:
+            content_prefix = prefix_str
+        elif is_last and len(children) == 0:
+            content_prefix = prefix_str + "   "  # Empty space under last item
+        else:
+            content_prefix = prefix_str + "│  "  # Continuation line
+        
         for i, content in enumerate(content_to_show):
             is_content_last = (i == total_content - 1)
-            
-            # Update prefix for content
-            new_prefix = prefix.copy()
-            if not is_root:
-                if is_last and len(node.children) == 0:
-                    new_prefix.append("   ")  # Empty space under last item
-                else:
-                    new_prefix.append("│  ")  # Continuation line
-            
-            generate_git_lines(content, lines, new_prefix, is_content_last, show_content=False)
+            generate_git_lines(content, emit, content_prefix, is_content_last, show_content=False)
         
         # Show summary if there are more content elements
-        if len(node.content_elements) > 8:
-            remaining = len(node.content_elements) - 8
-            branch_chars = ''.join(new_prefix) + "└─ "
-            lines.append(f"{branch_chars}  📄 ... and {remaining} more content elements")
+        if len(content_elements) > 8:
+            remaining = len(content_elements) - 8
+            branch_chars = content_prefix + "└─ "
+            emit(f"{branch_chars}  📄 ... and {remaining} more content elements")
 
 
-def create_compact_git_visualization(hierarchy_file: str) -> str:
+def create_compact_git_visualization(hierarchy: Union[str, Dict[str, Any]]) -> str:
     """Create a compact git-style visualization showing only structural elements."""
     
-    with open(hierarchy_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = _load_hierarchy(hierarchy)
     
-    root = convert_to_viz_node(data)
+    buf = io.StringIO()
+    generate_compact_git_lines(data, _line_emitter(buf.write), "", True, is_root=True)
     
-    lines = []
-    generate_compact_git_lines(root, lines, [], True, is_root=True)
-    
-    return '\n'.join(lines)
+    return buf.getvalue()
 
 
-def generate_compact_git_lines(node: VisualizationNode, lines: List[str], prefix: List[str], 
+def generate_compact_git_lines(node: Dict[str, Any], emit: Callable[[str], None], prefix_str: str, 
                              is_last: bool, is_root: bool = False):
     """Generate compact git-style lines showing only structure + content count."""
+    get = node.get
+    label = get('label', '')
     
     # Only show structural nodes
-    if not (node.label in ['title', 'document', 'sec'] or node.label.startswith('sub_')):
+    if not _is_structural(label):
         return
     
-    icon_map = {
-        'title': '📖',
-        'document': '📚', 
-        'sec': '📑',
-        'sub_sec': '📝',
-        'sub_sub_sec': '•',
-    }
-    
-    if node.label.startswith('sub_'):
-        sub_count = node.label.count('sub_')
-        icons = ['📝', '•', '◦', '‣', '▪', '▫']
-        icon = icons[min(sub_count - 1, len(icons) - 1)]
-    else:
-        icon = icon_map.get(node.label, '?')
+    # Structural labels all resolve the same way in the full icon table
+    icon = _node_icon(label, ICON_MAP, SUB_SECTION_ICONS)
     
     # Create the current line
     if is_root:
         branch_chars = ""
     else:
-        branch_chars = ''.join(prefix)
-        if is_last:
-            branch_chars += "└─ "
-        else:
-            branch_chars += "├─ "
+        branch_chars = prefix_str + ("└─ " if is_last else "├─ ")
     
     # Format node info
-    text = node.text[:50] + ('...' if len(node.text) > 50 else '')
-    content_count = len(node.content_elements)
+    page = get('page', 0)
+    text = _display_text(get('text', ''), 50)
+    content_count = len(get('content_elements', ()))
     content_info = f" [{content_count} items]" if content_count > 0 else ""
-    page_info = f" (p.{node.page})" if node.page > 0 else ""
+    page_info = f" (p.{page})" if page > 0 else ""
     
     line = f"{branch_chars}{icon} {text}{page_info}{content_info}"
-    lines.append(line)
+    emit(line)
     
     # Process children
-    structural_children = [child for child in node.children 
-                          if child.label in ['title', 'document', 'sec'] or child.label.startswith('sub_')]
+    structural_children = [child for child in get('children', ())
+                          if _is_structural(child.get('label', ''))]
+    
+    if is_root:
+        child_prefix = prefix_str
+    else:
+        child_prefix = prefix_str + ("   " if is_last else "│  ")
     
     total_children = len(structural_children)
     for i, child in enumerate(structural_children):
         is_child_last = (i == total_children - 1)
-        
-        # Update prefix for child
-        new_prefix = prefix.copy()
-        if not is_root:
-            if is_last:
-                new_prefix.append("   ")
-            else:
-                new_prefix.append("│  ")
-        
-        generate_compact_git_lines(child, lines, new_prefix, is_child_last)
+        generate_compact_git_lines(child, emit, child_prefix, is_child_last)
 
 
-def create_horizontal_flow_visualization(hierarchy_file: str) -> str:
+def create_horizontal_flow_visualization(hierarchy: Union[str, Dict[str, Any]]) -> str:
     """Create a horizontal flow visualization showing the document flow."""
     
-    with open(hierarchy_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = _load_hierarchy(hierarchy)
     
-    root = convert_to_viz_node(data)
-    
-    lines = []
-    lines.append("DOCUMENT FLOW VISUALIZATION")
-    lines.append("=" * 80)
-    lines.append("")
+    buf = io.StringIO()
+    emit = _line_emitter(buf.write)
+    emit("DOCUMENT FLOW VISUALIZATION")
+    emit("=" * 80)
+    emit("")
     
     # Show the flow horizontally
-    generate_flow_lines(root, lines, 0)
+    generate_flow_lines(data, emit, 0)
     
-    return '\n'.join(lines)
+    return buf.getvalue()
 
 
-def generate_flow_lines(node: VisualizationNode, lines: List[str], depth: int):
+def generate_flow_lines(node: Dict[str, Any], emit: Callable[[str], None], depth: int):
     """Generate horizontal flow lines."""
-    
-    indent = "  " * depth
-    arrow = "→ " if depth > 0 else ""
-    
-    # Icon mapping
-    icon_map = {
-        'title': '📖',
-        'sec': '📑',
-        'sub_sec': '📝',
-        'sub_sub_sec': '•',
-        'para': '¶',
-        'figure': '🖼️',
-        'table': '📊',
-        'list_group': '📋',
-    }
-    
-    if node.label.startswith('sub_'):
-        sub_count = node.label.count('sub_')
-        icons = ['📝', '•', '◦', '‣']
-        icon = icons[min(sub_count - 1, len(icons) - 1)]
-    else:
-        icon = icon_map.get(node.label, '?')
+    get = node.get
+    label = get('label', '')
     
     # Only show structural elements in flow
-    if node.label in ['title', 'document', 'sec'] or node.label.startswith('sub_'):
-        text = node.text[:40] + ('...' if len(node.text) > 40 else '')
-        content_count = len(node.content_elements)
+    if _is_structural(label):
+        indent = "  " * depth
+        arrow = "→ " if depth > 0 else ""
+        icon = _node_icon(label, FLOW_ICON_MAP, FLOW_SUB_SECTION_ICONS)
+        
+        text = _display_text(get('text', ''), 40)
+        content_count = len(get('content_elements', ()))
         content_info = f" ({content_count} items)" if content_count > 0 else ""
         
-        lines.append(f"{indent}{arrow}{icon} {text}{content_info}")
+        emit(f"{indent}{arrow}{icon} {text}{content_info}")
         
         # Show children
-        for child in node.children:
-            generate_flow_lines(child, lines, depth + 1)
+        for child in get('children', ()):
+            generate_flow_lines(child, emit, depth + 1)
+
+
+# Parsed hierarchy handed to each worker process once, at pool start-up
+_worker_hierarchy: Optional[Dict[str, Any]] = None
+
+
+def _set_worker_hierarchy(data: Dict[str, Any]):
+    """Pool initializer: keep the parsed hierarchy for this worker."""
+    global _worker_hierarchy
+    _worker_hierarchy = data
+
+
+def _render_visualization(kind: str) -> str:
+    """Build one visualization by name; runs in a worker process."""
+    renderers = {
+        'full': create_git_style_visualization,
+        'compact': create_compact_git_visualization,
+        'flow': create_horizontal_flow_visualization,
+    }
+    return renderers[kind](_worker_hierarchy)
 
 
 def main():
@@ -288,12 +301,21 @@ def main():
     
     try:
         print("Creating git-style document hierarchy visualizations...")
+        
+        # Parse once; the three views are independent and CPU-bound, so build
+        # them in parallel from the same parsed hierarchy
+        data = _load_hierarchy(hierarchy_file)
+        kinds = ['full', 'compact', 'flow']
+        with ProcessPoolExecutor(
+            max_workers=len(kinds), initializer=_set_worker_hierarchy, initargs=(data,)
+        ) as executor:
+            full_viz, compact_viz, flow_viz = executor.map(_render_visualization, kinds)
+        
         print("\n" + "=" * 80)
         print("GIT-STYLE DOCUMENT HIERARCHY (Full Detail)")
         print("=" * 80)
         
         # Full detailed visualization
-        full_viz = create_git_style_visualization(hierarchy_file)
         print(full_viz)
         
         print("\n" + "=" * 80)
@@ -301,7 +323,6 @@ def main():
         print("=" * 80)
         
         # Compact visualization
-        compact_viz = create_compact_git_visualization(hierarchy_file)
         print(compact_viz)
         
         print("\n" + "=" * 80)
@@ -309,7 +330,6 @@ def main():
         print("=" * 80)
         
         # Flow visualization
-        flow_viz = create_horizontal_flow_visualization(hierarchy_file)
         print(flow_viz)
         
         # Save visualizations to files
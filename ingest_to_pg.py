@@ -11,39 +11,115 @@ Env vars:
 - JSON_FILE_PATH: optional explicit path to JSON; otherwise auto-detect single file
 - EMBEDDING_MODEL: optional, default 'text-embedding-3-small'
 - EMBEDDING_DIM: optional, default 1536 for text-embedding-3-small
+- EMBED_BATCH_SIZE: optional, texts per embeddings request (default 128)
+- EMBED_MAX_INFLIGHT: optional, concurrent embeddings requests (default 8)
+- EMBED_MAX_BATCH_TOKENS: optional, estimated token budget per embeddings request (default 250000)
+- EMBEDDING_PRECISION: optional, 'half' (halfvec, default) or 'full' (vector) storage
+- EMBEDDING_MIGRATE: optional, set to 1 to convert an existing embedding column to EMBEDDING_PRECISION
+- EMBED_CACHE_PATH: optional, SQLite file caching embeddings across runs (default .embed_cache.sqlite; empty disables)
+- INDEX_BUILD_MEM: optional, maintenance_work_mem for vector index builds (default '2GB')
+- BINARY_INDEX: optional, set to 1 to also build a binary-quantized (1 bit per dimension) HNSW index
+  for query_rag.py's two-stage search
 """
 
+import asyncio
+import hashlib
 import json
 import os
-from typing import Any, Dict, List, Optional
+import random
+import sqlite3
+from collections import deque
+from functools import lru_cache
+from typing import Any, BinaryIO, Dict, List, Optional, Sequence, Tuple
 from dataclasses import dataclass
 
 from dotenv import load_dotenv
 load_dotenv()
 
+import numpy as np
 import psycopg
+from pgvector import HalfVector, Vector
+from pgvector.psycopg import register_vector
 from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
 
 try:
-    from openai import OpenAI
-    _openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY")) if os.getenv("OPENAI_API_KEY") else None
-except Exception:
-    _openai_client = None
+    import orjson
+    _json_dumps = orjson.dumps
+except ImportError:  # Optional; serializes bbox/merged_elements several times faster
+    _json_dumps = json.dumps
+
+try:
+    import ijson
+except ImportError:  # Optional; without it the whole JSON tree is loaded before flattening
+    ijson = None
+
+try:
+    import tiktoken
+except ImportError:  # Optional; without it overlong texts are cut by byte length
+    tiktoken = None
+
+from openai import APIConnectionError, AsyncOpenAI, InternalServerError, RateLimitError
 
 DEFAULT_EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
 DEFAULT_EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "1536"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "128"))
+EMBED_MAX_INFLIGHT = int(os.getenv("EMBED_MAX_INFLIGHT", "8"))
+# OpenAI caps a single embeddings request at 300k tokens
+EMBED_MAX_BATCH_TOKENS = int(os.getenv("EMBED_MAX_BATCH_TOKENS", "250000"))
+EMBED_MAX_ATTEMPTS = 6
+# Backoff ceiling between attempts, in seconds
+EMBED_MAX_BACKOFF = 30.0
+# text-embedding-3-* accept 8192 tokens; leave headroom
+EMBED_MAX_TOKENS = 8000
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", ".embed_cache.sqlite")
+INDEX_BUILD_MEM = os.getenv("INDEX_BUILD_MEM", "2GB")
+# halfvec stores FP16, halving row, buffer and index size with negligible recall loss
+EMBEDDING_PRECISION = os.getenv("EMBEDDING_PRECISION", "half")
+EMBEDDING_MIGRATE = os.getenv("EMBEDDING_MIGRATE") == "1"
+BINARY_INDEX = os.getenv("BINARY_INDEX") == "1"
+VECTOR_TYPES = {"half": "halfvec", "full": "vector"}
+if EMBEDDING_PRECISION not in VECTOR_TYPES:
+    raise SystemExit("EMBEDDING_PRECISION must be 'half' or 'full'")
+# Index operator class family; must match the distance operator query_rag.py orders by.
+# Stored vectors are unit-length, so inner product ranks exactly like cosine
+VECTOR_OPS = "ip_ops"
+
+
+@dataclass
+class Node:
+    """One doc_nodes row; fields follow the table's column order."""
+    __slots__ = (
+        "id", "parent_id", "label", "text", "level", "page", "reading_order",
+        "section_number", "summary", "bbox", "merged_elements", "is_merged",
+    )
+    id: Optional[str]
+    parent_id: Optional[str]
+    label: Optional[str]
+    text: str
+    level: int
+    page: int
+    reading_order: int
+    section_number: Optional[str]
+    summary: Optional[str]
+    bbox: Any
+    merged_elements: Any
+    is_merged: bool
 
 
 def find_single_json_file(search_dir: str) -> Optional[str]:
     try:
         if not os.path.isdir(search_dir):
             return None
-        candidates = [
-            os.path.join(search_dir, f)
-            for f in os.listdir(search_dir)
-            if f.lower().endswith(".json") and os.path.isfile(os.path.join(search_dir, f))
-        ]
-        return candidates[0] if len(candidates) == 1 else None
+        found = None
+        # scandir's entries carry the file type, so no extra stat per entry
+        with os.scandir(search_dir) as it:
+            for entry in it:
+                if entry.name.lower().endswith(".json") and entry.is_file():
+                    if found is not None:
+                        return None  # more than one candidate; stop scanning
+                    found = entry.path
+        return found
     except Exception:
         return None
 
@@ -68,8 +144,23 @@ def connect_db() -> psycopg.Connection:
     return psycopg.connect(dsn, row_factory=dict_row)
 
 
+def configure_hnsw_params(vector_count: int) -> Tuple[int, int]:
+    """Pick HNSW (m, ef_construction) for the expected number of vectors.
+
+    Larger graphs need more links per node and a wider build-time search to
+    hold recall; small ones build faster with pgvector's defaults.
+    """
+    if vector_count < 100_000:
+        return 16, 64
+    if vector_count < 1_000_000:
+        return 24, 128
+    return 32, 200
+
+
 def ensure_schema(conn: psycopg.Connection):
-    with conn.cursor() as cur:
+    vec_type = VECTOR_TYPES[EMBEDDING_PRECISION]
+    # Pipeline the DDL so the statements go out without waiting on each reply
+    with conn.pipeline(), conn.cursor() as cur:
         # Enable pgvector extension
         cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
         # Nodes table
@@ -77,7 +168,8 @@ def ensure_schema(conn: psycopg.Connection):
             f"""
             CREATE TABLE IF NOT EXISTS doc_nodes (
                 id TEXT PRIMARY KEY,
-                parent_id TEXT REFERENCES doc_nodes(id) ON DELETE CASCADE,
+                parent_id TEXT REFERENCES doc_nodes(id) ON DELETE CASCADE
+                    DEFERRABLE INITIALLY DEFERRED,
                 label TEXT NOT NULL,
                 text TEXT NOT NULL,
                 level INT NOT NULL,
@@ -88,117 +180,621 @@ def ensure_schema(conn: psycopg.Connection):
                 bbox JSONB,
                 merged_elements JSONB,
                 is_merged BOOLEAN DEFAULT FALSE,
-                embedding VECTOR({DEFAULT_EMBEDDING_DIM})
+                embedding {vec_type.upper()}({DEFAULT_EMBEDDING_DIM}),
+                content_sha BYTEA,
+                ancestor_ids TEXT[]
             );
             """
         )
+        # Added after the table's first release
+        cur.execute("ALTER TABLE doc_nodes ADD COLUMN IF NOT EXISTS content_sha BYTEA")
+        cur.execute("ALTER TABLE doc_nodes ADD COLUMN IF NOT EXISTS ancestor_ids TEXT[]")
+        # Older tables check the parent FK per row; defer it to commit like new ones
+        cur.execute(
+            "ALTER TABLE doc_nodes ALTER CONSTRAINT doc_nodes_parent_id_fkey "
+            "DEFERRABLE INITIALLY DEFERRED"
+        )
+        # Tables created under the other precision keep it unless a migration is requested
+        existing_type = _embedding_column_type(cur)
+        if existing_type != vec_type:
+            if EMBEDDING_MIGRATE:
+                # The indexes are type-specific, so rebuild them after converting;
+                # the legacy IVFFlat index has to go too or the ALTER rebuilds it
+                cur.execute("DROP INDEX IF EXISTS idx_doc_nodes_embedding")
+                cur.execute("DROP INDEX IF EXISTS idx_doc_nodes_embedding_hnsw")
+                cur.execute("DROP INDEX IF EXISTS idx_doc_nodes_embedding_bit")
+                cur.execute(
+                    f"ALTER TABLE doc_nodes ALTER COLUMN embedding TYPE {vec_type}({DEFAULT_EMBEDDING_DIM}) "
+                    f"USING embedding::{vec_type}({DEFAULT_EMBEDDING_DIM})"
+                )
+            else:
+                print(f"doc_nodes.embedding is {existing_type}; set EMBEDDING_MIGRATE=1 to convert it to {vec_type}.")
+                vec_type = existing_type
         # Children index for faster tree queries
         cur.execute("CREATE INDEX IF NOT EXISTS idx_doc_nodes_parent ON doc_nodes(parent_id)")
-        # Vector index (use IVFFlat, needs ANALYZE and lists tuning)
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_doc_nodes_embedding ON doc_nodes USING ivfflat (embedding) WITH (lists = 100)")
+        # Vector index: HNSW keeps recall on inserts without a rebuild and needs
+        # no training data, unlike the IVFFlat index it replaces (dropped here
+        # for tables that are not being migrated)
+        cur.execute("DROP INDEX IF EXISTS idx_doc_nodes_embedding")
+        cur.execute("SELECT count(*) AS n FROM doc_nodes")
+        _create_vector_index(cur, vec_type, *configure_hnsw_params(cur.fetchone()["n"]))
         conn.commit()
 
 
-def openai_embed(text: Optional[str]) -> Optional[List[float]]:
-    if not _openai_client:
+def _embedding_column_type(cur: psycopg.Cursor) -> str:
+    cur.execute(
+        "SELECT udt_name FROM information_schema.columns "
+        "WHERE table_name = 'doc_nodes' AND column_name = 'embedding' AND table_schema = current_schema()"
+    )
+    return cur.fetchone()["udt_name"]
+
+
+def _create_vector_index(cur: psycopg.Cursor, vec_type: str, m: int, ef_construction: int):
+    # Enough build memory that the graph stays in RAM while indexing existing rows
+    cur.execute("SELECT set_config('maintenance_work_mem', %s, true)", (INDEX_BUILD_MEM,))
+    # Partial on the predicate query_rag.py filters by, so the planner drops that filter from the scan
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_doc_nodes_embedding_hnsw ON doc_nodes "
+        f"USING hnsw (embedding {vec_type}_{VECTOR_OPS}) WITH (m = {m}, ef_construction = {ef_construction}) "
+        "WHERE embedding IS NOT NULL"
+    )
+    if BINARY_INDEX:
+        # A sign bit per dimension: 32x smaller than halfvec, compared by popcount
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_doc_nodes_embedding_bit ON doc_nodes USING hnsw "
+            f"((binary_quantize(embedding)::bit({DEFAULT_EMBEDDING_DIM})) bit_hamming_ops) "
+            f"WITH (m = {m}, ef_construction = {ef_construction}) WHERE embedding IS NOT NULL"
+        )
+
+
+def retune_vector_index(conn: psycopg.Connection):
+    """Rebuild the HNSW index if its parameters, operator class or predicate are out of date, then ANALYZE.
+
+    The index is first built for however many rows existed before the load;
+    a large ingest can move the table into a bigger configure_hnsw_params tier.
+    An index built for another distance than VECTOR_OPS would not serve queries.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) AS n FROM doc_nodes WHERE embedding IS NOT NULL")
+        m, ef_construction = configure_hnsw_params(cur.fetchone()["n"])
+        vec_type = _embedding_column_type(cur)
+        cur.execute(
+            """
+            SELECT c.reloptions, o.opcname, i.indpred IS NOT NULL AS partial
+            FROM pg_class c
+            JOIN pg_index i ON i.indexrelid = c.oid
+            JOIN pg_opclass o ON o.oid = i.indclass[0]
+            WHERE c.relname = 'idx_doc_nodes_embedding_hnsw'
+            """
+        )
+        row = cur.fetchone()
+        current = set(row["reloptions"] or []) if row else set()
+        opclass = row["opcname"] if row else None
+        partial = bool(row and row["partial"])
+        if (current != {f"m={m}", f"ef_construction={ef_construction}"}
+                or opclass != f"{vec_type}_{VECTOR_OPS}" or not partial):
+            print(f"Rebuilding vector index with {vec_type}_{VECTOR_OPS}, m={m}, ef_construction={ef_construction}.")
+            cur.execute("DROP INDEX IF EXISTS idx_doc_nodes_embedding_hnsw")
+            cur.execute("DROP INDEX IF EXISTS idx_doc_nodes_embedding_bit")
+            _create_vector_index(cur, vec_type, m, ef_construction)
+        # Fresh planner statistics after the bulk load
+        cur.execute("ANALYZE doc_nodes")
+    conn.commit()
+
+
+def refresh_ancestor_ids(conn: psycopg.Connection):
+    """Materialize every node's root-to-parent id path in ancestor_ids.
+
+    Readers then fetch a node's ancestors with one primary-key lookup instead of
+    a recursive query. Recomputed from parent_id after each load, which also
+    backfills older tables; rows whose path did not change are not rewritten.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            WITH RECURSIVE paths AS (
+                SELECT id, ARRAY[]::text[] AS ancestor_ids
+                FROM doc_nodes WHERE parent_id IS NULL
+                UNION ALL
+                SELECT d.id, p.ancestor_ids || d.parent_id
+                FROM doc_nodes d
+                JOIN paths p ON d.parent_id = p.id
+            )
+            UPDATE doc_nodes d SET ancestor_ids = p.ancestor_ids
+            FROM paths p
+            WHERE d.id = p.id AND d.ancestor_ids IS DISTINCT FROM p.ancestor_ids
+            """
+        )
+    conn.commit()
+
+
+def embeddings_enabled() -> bool:
+    return bool(os.getenv("OPENAI_API_KEY"))
+
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    if tiktoken is None:
         return None
+    try:
+        return tiktoken.encoding_for_model(DEFAULT_EMBEDDING_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def prepare_embedding_text(text: Optional[str]) -> str:
+    """Strip text and cut it to EMBED_MAX_TOKENS so the API never rejects it."""
     t = (text or "").strip()
-    if not t:
+    raw = t.encode("utf-8")
+    # Every token covers at least one byte, so short texts need no tokenizing
+    if len(raw) <= EMBED_MAX_TOKENS:
+        return t
+    encoding = get_encoding()
+    if encoding is None:
+        return raw[:EMBED_MAX_TOKENS].decode("utf-8", errors="ignore")
+    tokens = encoding.encode(t)
+    if len(tokens) <= EMBED_MAX_TOKENS:
+        return t
+    return encoding.decode(tokens[:EMBED_MAX_TOKENS])
+
+
+def normalize_embedding(values: Sequence[float]) -> np.ndarray:
+    """float32 unit vector, so the inner-product index orders rows by cosine similarity.
+
+    OpenAI embeddings are already unit-length; this only guards against drift.
+    """
+    vec = np.asarray(values, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else vec
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Seconds to wait before retrying: the server's Retry-After if given, else full-jitter backoff."""
+    if isinstance(error, RateLimitError):
+        retry_after = error.response.headers.get("retry-after")
+        try:
+            return min(float(retry_after), EMBED_MAX_BACKOFF)
+        except (TypeError, ValueError):
+            pass
+    return random.uniform(0, min(EMBED_MAX_BACKOFF, 0.5 * 2 ** attempt))
+
+
+async def _embed_one_batch(client: "AsyncOpenAI", batch: List[str], semaphore: asyncio.Semaphore) -> List[np.ndarray]:
+    """Embed one batch, retrying rate limits, connection errors and 5xx with backoff."""
+    # Spread the first requests out so concurrent batches don't hit the API in lockstep
+    await asyncio.sleep(random.uniform(0, 0.25))
+    for attempt in range(1, EMBED_MAX_ATTEMPTS + 1):
+        try:
+            async with semaphore:
+                resp = await client.embeddings.create(model=DEFAULT_EMBEDDING_MODEL, input=batch)
+            # float32 arrays: a quarter of the memory of float lists, and pgvector's adapter takes them as-is
+            return [normalize_embedding(d.embedding) for d in sorted(resp.data, key=lambda d: d.index)]
+        except (RateLimitError, APIConnectionError, InternalServerError) as e:
+            if attempt == EMBED_MAX_ATTEMPTS:
+                raise
+            delay = _retry_delay(e, attempt)
+            print(f"Embedding batch failed (attempt {attempt}/{EMBED_MAX_ATTEMPTS}): {e}; retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+def _pack_batches(pending: List[Tuple[int, str]]) -> List[List[Tuple[int, str]]]:
+    """Group (index, text) pairs into requests of similar-length texts.
+
+    Longest texts go first so each request's latency isn't set by one outlier,
+    and every request stays within EMBED_BATCH_SIZE inputs and
+    EMBED_MAX_BATCH_TOKENS estimated tokens (about 4 characters per token).
+    """
+    batches: List[List[Tuple[int, str]]] = []
+    batch: List[Tuple[int, str]] = []
+    batch_tokens = 0
+    for item in sorted(pending, key=lambda p: len(p[1]), reverse=True):
+        tokens = len(item[1]) // 4 + 1
+        if batch and (len(batch) == EMBED_BATCH_SIZE or batch_tokens + tokens > EMBED_MAX_BATCH_TOKENS):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(item)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+async def _embed_all(texts: List[Optional[str]]) -> List[Optional[np.ndarray]]:
+    """Embed texts in batches, with up to EMBED_MAX_INFLIGHT requests in flight.
+
+    Returns one entry per input, in input order; empty texts (and batches
+    that still fail after retries) come back as None.
+    """
+    out: List[Optional[np.ndarray]] = [None] * len(texts)
+    # Remember where each non-empty text came from so results map back to rows
+    pending = [(i, t) for i, t in ((i, (text or "").strip()) for i, text in enumerate(texts)) if t]
+    batches = _pack_batches(pending)
+    if not batches:
+        return out
+
+    semaphore = asyncio.Semaphore(EMBED_MAX_INFLIGHT)
+    async with AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")) as client:
+        tasks = [
+            asyncio.create_task(_embed_one_batch(client, [t for _, t in batch], semaphore))
+            for batch in batches
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    for batch, result in zip(batches, results):
+        if isinstance(result, BaseException):
+            print(f"Embedding error: {result}")
+            continue
+        for (i, _), vec in zip(batch, result):
+            out[i] = vec
+    return out
+
+
+def _embed_cache_key(text: str) -> str:
+    # The model is part of the key so switching models never reuses stale vectors
+    return hashlib.blake2b(f"{DEFAULT_EMBEDDING_MODEL}|{text}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _open_embed_cache() -> Optional[sqlite3.Connection]:
+    if not EMBED_CACHE_PATH:
         return None
-    # OpenAI's embeddings API in >=1.x client
+    db = sqlite3.connect(EMBED_CACHE_PATH)
+    db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB NOT NULL)")
+    return db
+
+
+def _cache_get_many(db: sqlite3.Connection, keys: List[str]) -> Dict[str, np.ndarray]:
+    found: Dict[str, np.ndarray] = {}
+    # Stay under SQLite's bound-parameter limit
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        for key, blob in db.execute(f"SELECT key, vec FROM embeddings WHERE key IN ({placeholders})", chunk):
+            found[key] = np.frombuffer(blob, dtype=np.float32)
+    return found
+
+
+def _cache_put_many(db: sqlite3.Connection, items: List[Tuple[str, np.ndarray]]):
+    with db:
+        db.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)",
+            ((key, vec.tobytes()) for key, vec in items)
+        )
+
+
+async def openai_embed_batch_async(texts: List[Optional[str]]) -> List[Optional[np.ndarray]]:
+    """Embed many texts concurrently in batches; see _embed_all.
+
+    Identical texts are embedded once per run, and texts embedded in earlier
+    runs are served from the on-disk cache without calling the API.
+    """
+    out: List[Optional[np.ndarray]] = [None] * len(texts)
+    if not embeddings_enabled():
+        return out
+
+    positions: Dict[str, List[int]] = {}
+    for i, text in enumerate(texts):
+        # Truncate per text so one overlong item can't fail its whole batch
+        t = prepare_embedding_text(text)
+        if t:
+            positions.setdefault(t, []).append(i)
+
+    cache = _open_embed_cache()
     try:
-        resp = _openai_client.embeddings.create(model=DEFAULT_EMBEDDING_MODEL, input=t)
-        vec = resp.data[0].embedding if resp and resp.data else None
-        return vec
-    except Exception as e:
-        print(f"Embedding error: {e}")
-        return None
+        keys = {t: _embed_cache_key(t) for t in positions}
+        cached = _cache_get_many(cache, list(keys.values())) if cache else {}
+        misses = [t for t in positions if keys[t] not in cached]
+        print(f"Embeddings: {len(positions) - len(misses)} cached, {len(misses)} to request.")
+        fresh = dict(zip(misses, await _embed_all(misses))) if misses else {}
+        if cache:
+            _cache_put_many(cache, [(keys[t], vec) for t, vec in fresh.items() if vec is not None])
+    finally:
+        if cache:
+            cache.close()
+
+    for t, indices in positions.items():
+        vec = cached.get(keys[t])
+        if vec is None:
+            vec = fresh.get(t)
+        for i in indices:
+            out[i] = vec
+    return out
+
+
+# Keys whose arrays hold child nodes rather than node fields
+NODE_LIST_KEYS = ("children", "content_elements")
+
+
+def _make_node(g, pid: Optional[str]) -> Node:
+    # g is the .get of a node's JSON object (or of its collected fields)
+    return Node(
+        g("id"),
+        pid,
+        g("label"),
+        g("text", ""),
+        g("level", -1),
+        g("page", 0),
+        g("reading_order", 0),
+        g("section_number"),
+        g("summary"),
+        g("bbox"),
+        g("merged_elements"),
+        g("is_merged", False)
+    )
+
+
+class _NodeFrame:
+    """A JSON node whose object is still being parsed by stream_hierarchy_rows."""
+    __slots__ = ("fields", "rows", "direct_children", "pending_key", "list_key")
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        # Flattened subtree rows per list key, kept apart so children precede content
+        self.rows: Dict[str, List[Node]] = {key: [] for key in NODE_LIST_KEYS}
+        self.direct_children: List[Node] = []
+        self.pending_key: Optional[str] = None
+        self.list_key: Optional[str] = None
+
+
+def stream_hierarchy_rows(f: BinaryIO, parent_id: Optional[str] = None) -> List[Node]:
+    """Flatten the hierarchy straight from ijson parse events.
+
+    Only node fields are ever built as Python objects, never the full JSON
+    tree. Rows come out in the same order as flatten_hierarchy. If the
+    document is a list, only its first node is used.
+    """
+    frames: List[_NodeFrame] = []
+    builder = None
+    builder_key = None
+    depth = 0
+    for _, event, value in ijson.parse(f, use_float=True):
+        if builder is not None:
+            # Collecting a plain field value (scalar, bbox list, merged_elements, ...)
+            builder.event(event, value)
+            if event in ("start_map", "start_array"):
+                depth += 1
+            elif event in ("end_map", "end_array"):
+                depth -= 1
+            if depth == 0:
+                frames[-1].fields[builder_key] = builder.value
+                builder = None
+            continue
+
+        if not frames:
+            # Skip a top-level list wrapper; the first object is the root
+            if event == "start_map":
+                frames.append(_NodeFrame())
+            continue
 
+        frame = frames[-1]
+        if frame.pending_key is not None:
+            # A children/content_elements value; anything but an array means no nodes
+            key, frame.pending_key = frame.pending_key, None
+            if event == "start_array":
+                frame.list_key = key
+                continue
+        if event == "map_key":
+            if value in NODE_LIST_KEYS:
+                frame.pending_key = value
+            else:
+                builder = ijson.ObjectBuilder()
+                builder_key = value
+                depth = 0
+        elif event == "start_map" and frame.list_key is not None:
+            frames.append(_NodeFrame())
+        elif event == "end_array" and frame.list_key is not None:
+            frame.list_key = None
+        elif event == "end_map":
+            frames.pop()
+            node = _make_node(frame.fields.get, None)
+            for child in frame.direct_children:
+                child.parent_id = node.id
+            subtree = [node]
+            for key in NODE_LIST_KEYS:
+                subtree.extend(frame.rows[key])
+            if not frames:
+                node.parent_id = parent_id
+                return subtree
+            parent = frames[-1]
+            parent.rows[parent.list_key].extend(subtree)
+            parent.direct_children.append(node)
+    return []
 
-def flatten_hierarchy(node: Dict[str, Any], parent_id: Optional[str] = None) -> List[Dict[str, Any]]:
-    rows: List[Dict[str, Any]] = []
-    def _recurse(n: Dict[str, Any], pid: Optional[str]):
-        rows.append({
-            "id": n.get("id"),
-            "parent_id": pid,
-            "label": n.get("label"),
-            "text": n.get("text", ""),
-            "level": n.get("level", -1),
-            "page": n.get("page", 0),
-            "reading_order": n.get("reading_order", 0),
-            "section_number": n.get("section_number"),
-            "summary": n.get("summary"),
-            "bbox": n.get("bbox"),
-            "merged_elements": n.get("merged_elements"),
-            "is_merged": n.get("is_merged", False)
-        })
-        # structural children
-        for c in n.get("children", []) or []:
-            _recurse(c, n.get("id"))
-        # content elements are also nodes in the same table with parent_id pointing to the structural node
-        for c in n.get("content_elements", []) or []:
-            _recurse(c, n.get("id"))
-    _recurse(node, parent_id)
+
+def flatten_hierarchy(node: Dict[str, Any], parent_id: Optional[str] = None) -> List[Node]:
+    rows: List[Node] = []
+    append = rows.append
+    # Explicit stack instead of recursion: no frame per node and no recursion limit on deep trees.
+    # Children are pushed in reverse so nodes pop in the same pre-order as a recursive walk.
+    stack = [(node, parent_id)]
+    pop = stack.pop
+    while stack:
+        n, pid = pop()
+        g = n.get
+        nid = g("id")
+        append(_make_node(g, pid))
+        # content elements are also nodes in the same table with parent_id pointing to the structural node;
+        # they follow all structural children
+        stack.extend((c, nid) for c in reversed(g("content_elements") or []))
+        stack.extend((c, nid) for c in reversed(g("children") or []))
     return rows
 
 
-def upsert_nodes(conn: psycopg.Connection, rows: List[Dict[str, Any]], do_embed: bool):
+def order_parents_first(rows: List[Node]) -> List[Node]:
+    """Reorder rows so every parent precedes its children (Kahn-style walk, O(N)).
+
+    Rows whose parent is not in the batch start the walk. Rows unreachable from
+    those (a parent_id cycle) keep their relative order at the end.
+    """
+    ids = {r.id for r in rows}
+    children_of: Dict[str, List[Node]] = {}
+    queue = deque()
+    for r in rows:
+        if r.parent_id is None or r.parent_id not in ids:
+            queue.append(r)
+        else:
+            children_of.setdefault(r.parent_id, []).append(r)
+    ordered: List[Node] = []
+    append = ordered.append
+    popleft = queue.popleft
+    while queue:
+        r = popleft()
+        append(r)
+        # pop so a duplicated id cannot emit the same children twice
+        queue.extend(children_of.pop(r.id, ()))
+    if len(ordered) < len(rows):
+        for group in children_of.values():
+            ordered.extend(group)
+    return ordered
+
+
+# Column order shared by the COPY stream and the merge statement
+NODE_COLUMNS = (
+    "id", "parent_id", "label", "text", "level", "page", "reading_order",
+    "section_number", "summary", "bbox", "merged_elements", "is_merged", "embedding", "content_sha",
+)
+
+
+def content_sha(r: Node) -> bytes:
+    """Stable digest of every stored field except the embedding."""
+    fields = [
+        r.id, r.parent_id, r.label, r.text, r.level, r.page, r.reading_order,
+        r.section_number, r.summary, r.bbox, r.merged_elements, r.is_merged,
+    ]
+    payload = json.dumps(fields, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+def find_unchanged_ids(conn: psycopg.Connection, rows: List[Node], shas: List[bytes],
+                       require_embedding: bool) -> set:
+    """Ids whose stored content_sha matches, i.e. rows that need no write at all.
+
+    With require_embedding, rows still missing an embedding are not counted as
+    unchanged so they get embedded this run.
+    """
     with conn.cursor() as cur:
-        for r in rows:
-            emb = None
-            if do_embed:
-                # Prefer summary for semantic signal; fallback to text
-                emb = openai_embed(r.get("summary") or r.get("text"))
-            cur.execute(
-                """
-                INSERT INTO doc_nodes (
-                    id, parent_id, label, text, level, page, reading_order,
-                    section_number, summary, bbox, merged_elements, is_merged, embedding
-                ) VALUES (
-                    %(id)s, %(parent_id)s, %(label)s, %(text)s, %(level)s, %(page)s, %(reading_order)s,
-                    %(section_number)s, %(summary)s, %(bbox)s, %(merged_elements)s, %(is_merged)s, %(embedding)s
-                )
-                ON CONFLICT (id) DO UPDATE SET
-                    parent_id = EXCLUDED.parent_id,
-                    label = EXCLUDED.label,
-                    text = EXCLUDED.text,
-                    level = EXCLUDED.level,
-                    page = EXCLUDED.page,
-                    reading_order = EXCLUDED.reading_order,
-                    section_number = EXCLUDED.section_number,
-                    summary = EXCLUDED.summary,
-                    bbox = EXCLUDED.bbox,
-                    merged_elements = EXCLUDED.merged_elements,
-                    is_merged = EXCLUDED.is_merged,
-                    embedding = COALESCE(EXCLUDED.embedding, doc_nodes.embedding)
-                """,
-                {
-                    **r,
-                    "bbox": json.dumps(r.get("bbox")) if r.get("bbox") is not None else None,
-                    "merged_elements": json.dumps(r.get("merged_elements")) if r.get("merged_elements") is not None else None,
-                    "embedding": emb
-                }
-            )
+        # Before the first ingest there is nothing to compare against
+        cur.execute(
+            "SELECT 1 FROM information_schema.columns WHERE table_schema = current_schema() "
+            "AND table_name = 'doc_nodes' AND column_name = 'content_sha'"
+        )
+        if cur.fetchone() is None:
+            return set()
+        cur.execute(
+            """
+            SELECT d.id FROM doc_nodes d
+            JOIN unnest(%s::text[], %s::bytea[]) AS u(id, sha)
+              ON d.id = u.id AND d.content_sha = u.sha
+            """ + ("WHERE d.embedding IS NOT NULL" if require_embedding else ""),
+            ([r.id for r in rows], shas)
+        )
+        return {row["id"] for row in cur}
+
+
+def upsert_nodes(conn: psycopg.Connection, rows: List[Node],
+                 embeddings: Optional[List[Optional[np.ndarray]]] = None,
+                 shas: Optional[List[bytes]] = None):
+    if embeddings is None:
+        embeddings = [None] * len(rows)
+    if shas is None:
+        shas = [content_sha(r) for r in rows]
+    columns = ", ".join(NODE_COLUMNS)
+    with conn.cursor() as cur:
+        # Validate the parent FK once at commit rather than row by row during the merge
+        cur.execute("SET CONSTRAINTS doc_nodes_parent_id_fkey DEFERRED")
+        # Stream every row into a staging table with one COPY, then merge in a single statement
+        cur.execute("CREATE TEMP TABLE tmp_doc_nodes (LIKE doc_nodes INCLUDING DEFAULTS) ON COMMIT DROP")
+        # The staging table copies the column's type, which ingest may have kept from an older run
+        vec_type = _embedding_column_type(cur)
+        to_vector = HalfVector if vec_type == "halfvec" else Vector
+        # Binary COPY sends each embedding as packed floats instead of ~20 KB of '[...]' text
+        with cur.copy(f"COPY tmp_doc_nodes ({columns}) FROM STDIN (FORMAT BINARY)") as copy:
+            copy.set_types([
+                "text", "text", "text", "text", "int4", "int4", "int4", "text", "text",
+                "jsonb", "jsonb", "bool", vec_type, "bytea",
+            ])
+            for r, emb, sha in zip(rows, embeddings, shas):
+                copy.write_row((
+                    r.id, r.parent_id, r.label, r.text, r.level, r.page,
+                    r.reading_order, r.section_number, r.summary,
+                    Jsonb(r.bbox, dumps=_json_dumps) if r.bbox is not None else None,
+                    Jsonb(r.merged_elements, dumps=_json_dumps) if r.merged_elements is not None else None,
+                    r.is_merged, to_vector(emb) if emb is not None else None, sha,
+                ))
+        cur.execute(
+            f"""
+            INSERT INTO doc_nodes ({columns})
+            SELECT {columns} FROM tmp_doc_nodes
+            ON CONFLICT (id) DO UPDATE SET
+                parent_id = EXCLUDED.parent_id,
+                label = EXCLUDED.label,
+                text = EXCLUDED.text,
+                level = EXCLUDED.level,
+                page = EXCLUDED.page,
+                reading_order = EXCLUDED.reading_order,
+                section_number = EXCLUDED.section_number,
+                summary = EXCLUDED.summary,
+                bbox = EXCLUDED.bbox,
+                merged_elements = EXCLUDED.merged_elements,
+                is_merged = EXCLUDED.is_merged,
+                embedding = COALESCE(EXCLUDED.embedding, doc_nodes.embedding),
+                content_sha = EXCLUDED.content_sha
+            -- Identical rows cost no write, WAL or index maintenance
+            WHERE doc_nodes.content_sha IS DISTINCT FROM EXCLUDED.content_sha
+               OR (doc_nodes.embedding IS NULL AND EXCLUDED.embedding IS NOT NULL)
+            """
+        )
         conn.commit()
 
 
+async def _embed_while_preparing_schema(conn: psycopg.Connection, rows: List[Node],
+                                        do_embed: bool) -> Optional[List[Optional[np.ndarray]]]:
+    # The DDL runs on a worker thread while the embedding requests are in flight
+    schema = asyncio.to_thread(ensure_schema, conn)
+    if not do_embed:
+        await schema
+        return None
+    # Prefer summary for semantic signal; fallback to text
+    embeddings, _ = await asyncio.gather(
+        openai_embed_batch_async([r.summary or r.text for r in rows]), schema
+    )
+    return embeddings
+
+
 def main():
     json_path = get_json_path()
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    # The enhanced JSON may already be a root dict; if it's a list, take first
-    root = data if isinstance(data, dict) else (data[0] if data else {})
-
-    rows = flatten_hierarchy(root)
+    if ijson is not None:
+        # Build rows from parse events without holding the whole JSON tree
+        with open(json_path, "rb") as f:
+            rows = stream_hierarchy_rows(f)
+    else:
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        # The enhanced JSON may already be a root dict; if it's a list, take first
+        root = data if isinstance(data, dict) else (data[0] if data else {})
+        rows = flatten_hierarchy(root)
+    # Parents first, so the FK holds at every point of the insert, not just at commit
+    rows = order_parents_first(rows)
     print(f"Prepared {len(rows)} nodes for upsert.")
 
-    do_embed = bool(_openai_client)
+    do_embed = embeddings_enabled()
     if not do_embed:
         print("OPENAI_API_KEY missing; embeddings will be NULL.")
 
+    shas = [content_sha(r) for r in rows]
     with connect_db() as conn:
-        ensure_schema(conn)
-        upsert_nodes(conn, rows, do_embed)
+        # Unchanged nodes skip both embedding and the upsert
+        unchanged = find_unchanged_ids(conn, rows, shas, require_embedding=do_embed)
+        if unchanged:
+            kept = [i for i, r in enumerate(rows) if r.id not in unchanged]
+            rows = [rows[i] for i in kept]
+            shas = [shas[i] for i in kept]
+            print(f"Skipping {len(unchanged)} unchanged nodes; {len(rows)} to upsert.")
+        embeddings = asyncio.run(_embed_while_preparing_schema(conn, rows, do_embed))
+        # The vector types exist only once ensure_schema has created the extension
+        register_vector(conn)
+        upsert_nodes(conn, rows, embeddings, shas)
+        refresh_ancestor_ids(conn)
+        retune_vector_index(conn)
     print("Ingestion complete.")
 
 
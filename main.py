@@ -5,41 +5,254 @@ Creates a hierarchical graph structure with unlimited nesting depth and merged e
 Includes summary generation using OpenAI API and embeddings support.
 """
 
+import asyncio
+import hashlib
 import json
 import re
 import os
+import random
+import sqlite3
 import sys
 import argparse
-from typing import Dict, List, Any, Optional, Union, Tuple
-from dataclasses import dataclass, field
+from enum import IntEnum
+from functools import lru_cache
+from typing import Dict, Iterator, List, Any, Optional, Union, Tuple
 from collections import defaultdict
-from openai import OpenAI
+from contextlib import asynccontextmanager
+import httpx
+import numpy as np
+from openai import APIConnectionError, AsyncOpenAI, InternalServerError, RateLimitError
 from dotenv import load_dotenv
 
+try:
+    import tiktoken
+except ImportError:  # Optional; without it overlong texts are cut by byte length
+    tiktoken = None
+
+try:
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:  # Optional; without it concurrent requests use separate HTTP/1.1 connections
+    _HTTP2 = False
+
 # Load environment variables from .env file
 # load_dotenv()
 
-# Initialize OpenAI client
-if os.getenv("OPENAI_API_KEY"):
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+SUMMARY_MODEL = "gpt-3.5-turbo"
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Longest text, in tokens, put into a summary prompt
+SUMMARY_MAX_INPUT_TOKENS = int(os.getenv("SUMMARY_MAX_INPUT_TOKENS", "1500"))
+# Texts sent per embeddings request
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+# Generated summaries and embeddings are kept here so unchanged content is never summarized twice; empty disables
+SUMMARY_CACHE_PATH = os.getenv("SUMMARY_CACHE_PATH", "summary_cache.db")
+# Rate limits, timeouts, dropped connections and 5xx are retried; other errors are not
+TRANSIENT_OPENAI_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+OPENAI_MAX_ATTEMPTS = 6
+# Ceiling in seconds for a single retry delay
+OPENAI_MAX_BACKOFF = 30.0
+# Pooled keep-alive connections shared by every OpenAI request of a run
+OPENAI_HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=64)
+# Upper bound on summary requests in flight at once
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "20"))
+# Seconds between status checks of a submitted Batch API job
+BATCH_POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", "30"))
+BATCH_TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+# Leaves summarized per chat call; 1 sends one call per leaf
+LEAF_SUMMARY_GROUP_SIZE = int(os.getenv("LEAF_SUMMARY_GROUP_SIZE", "20"))
+
+# Leading section number such as "3" or "4.2.1"; \s* skips leading whitespace without a strip() copy
+_SECTION_NUMBER_RE = re.compile(r'^\s*(\d+(?:\.\d+)*)')
+CONTENT_LABELS = frozenset(['para', 'list', 'list_group', 'figure', 'table',
+                            'cap', 'fig', 'tab', 'fnote', 'foot', 'author'])
+
+
+class LabelKind(IntEnum):
+    """What a node label denotes in the hierarchy."""
+    DOCUMENT = 0
+    TITLE = 1
+    SECTION = 2
+    SUBSECTION = 3  # sub_sec, sub_sub_sec, ... at any depth
+    CONTENT = 4
+    OTHER = 5
+
+
+STRUCTURAL_KINDS = frozenset([LabelKind.DOCUMENT, LabelKind.TITLE, LabelKind.SECTION, LabelKind.SUBSECTION])
+_KIND_LEVEL_BY_LABEL = {
+    'document': (LabelKind.DOCUMENT, -1),
+    'title': (LabelKind.TITLE, 0),
+    'sec': (LabelKind.SECTION, 1),
+}
+
+
+@lru_cache(maxsize=32)
+def parse_label(label: str) -> Tuple[LabelKind, int]:
+    """Kind and nesting level of a label, parsed once per distinct label.
+    
+    Levels: title=0, sec=1, sub_sec=2, sub_sub_sec=3, ...; anything else is -1.
+    """
+    known = _KIND_LEVEL_BY_LABEL.get(label)
+    if known is not None:
+        return known
+    if label.startswith('sub_'):
+        # Count the number of 'sub_' prefixes for unlimited depth
+        return LabelKind.SUBSECTION, label.count('sub_') + 1
+    return (LabelKind.CONTENT if label in CONTENT_LABELS else LabelKind.OTHER), -1
+
+
+class SummaryCache:
+    """SQLite-backed store of generated summaries and embeddings keyed by sha256(model, prompt)."""
+    
+    def __init__(self, path: str = SUMMARY_CACHE_PATH):
+        self._conn = sqlite3.connect(path)
+        # WAL lets a concurrent run read while this one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        # Embeddings are stored as raw float32 bytes
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+        self._conn.commit()
+    
+    @staticmethod
+    def key(model: str, prompt: str) -> str:
+        """Cache key for a prompt sent to a model."""
+        return hashlib.sha256(f"{model}\x00{prompt}".encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for key, or None."""
+        row = self._conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+    
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        """Return the cached values for whichever of keys are present."""
+        found = {}
+        # Stay under SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(self._conn.execute(
+                f"SELECT key, value FROM cache WHERE key IN ({placeholders})", chunk
+            ).fetchall())
+        return found
+    
+    def put_many(self, items: List[Tuple[str, str]]):
+        """Store key/value pairs in one transaction."""
+        if not items:
+            return
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)", items)
+    
+    def put(self, key: str, value: str):
+        """Store a single key/value pair."""
+        self.put_many([(key, value)])
+    
+    def get_embeddings(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Return the cached embedding vectors for whichever of keys are present."""
+        found = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for key, value in self._conn.execute(
+                f"SELECT key, value FROM embeddings WHERE key IN ({placeholders})", chunk
+            ):
+                found[key] = np.frombuffer(value, dtype=np.float32)
+        return found
+    
+    def put_embeddings(self, items: List[Tuple[str, np.ndarray]]):
+        """Store embedding vectors in one transaction."""
+        if not items:
+            return
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, value) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items]
+            )
+    
+    def close(self):
+        self._conn.close()
+
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(SUMMARY_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def cap_prompt_text(text: str) -> str:
+    """Cut text to SUMMARY_MAX_INPUT_TOKENS so one long element cannot inflate a prompt."""
+    raw = text.encode("utf-8")
+    # Every token covers at least one byte, so short texts need no tokenizing
+    if len(raw) <= SUMMARY_MAX_INPUT_TOKENS:
+        return text
+    encoding = get_encoding()
+    if encoding is None:
+        return raw[:SUMMARY_MAX_INPUT_TOKENS].decode("utf-8", errors="ignore")
+    tokens = encoding.encode(text)
+    if len(tokens) <= SUMMARY_MAX_INPUT_TOKENS:
+        return text
+    return encoding.decode(tokens[:SUMMARY_MAX_INPUT_TOKENS])
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Seconds to wait before retrying: the server's Retry-After if given, else full-jitter backoff."""
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            return min(float(response.headers.get("retry-after")), OPENAI_MAX_BACKOFF)
+        except (TypeError, ValueError):
+            pass
+    return random.uniform(0, min(OPENAI_MAX_BACKOFF, 2 ** attempt))
 
 
-@dataclass
 class EnhancedDocumentNode:
-    """Enhanced node in the document hierarchy with merging capabilities and summary support."""
-    id: str
-    label: str
-    text: str
-    level: int
-    page: int
-    reading_order: int
-    bbox: Optional[List[int]] = None
-    summary: Optional[str] = None
-    embeddings: List[float] = field(default_factory=list)
-    merged_elements: List[Dict[str, Any]] = field(default_factory=list)
-    parent: Optional['EnhancedDocumentNode'] = None
-    children: List['EnhancedDocumentNode'] = field(default_factory=list)
-    content_elements: List['EnhancedDocumentNode'] = field(default_factory=list)
+    """Enhanced node in the document hierarchy with merging capabilities and summary support.
+    
+    A plain class with __slots__, so the many nodes of a large document carry
+    no per-instance __dict__. Nodes compare by identity.
+    """
+    __slots__ = (
+        "id", "label", "text", "level", "page", "reading_order", "bbox", "summary",
+        "embeddings", "merged_elements", "parent", "children", "content_elements",
+        # Derived from label and text once, instead of on every traversal
+        "kind", "nesting_level", "_is_structural", "_is_content", "_section_number",
+    )
+    
+    def __init__(self, id: str, label: str, text: str, level: int, page: int, reading_order: int,
+                 bbox: Optional[List[int]] = None, summary: Optional[str] = None,
+                 embeddings: Optional[List[float]] = None,
+                 merged_elements: Optional[List[Dict[str, Any]]] = None,
+                 parent: Optional['EnhancedDocumentNode'] = None,
+                 children: Optional[List['EnhancedDocumentNode']] = None,
+                 content_elements: Optional[List['EnhancedDocumentNode']] = None):
+        self.id = id
+        self.label = label
+        self.text = text
+        self.level = level
+        self.page = page
+        self.reading_order = reading_order
+        self.bbox = bbox
+        self.summary = summary
+        self.embeddings: List[float] = [] if embeddings is None else embeddings
+        self.merged_elements: List[Dict[str, Any]] = [] if merged_elements is None else merged_elements
+        self.parent = parent
+        self.children: List['EnhancedDocumentNode'] = [] if children is None else children
+        self.content_elements: List['EnhancedDocumentNode'] = [] if content_elements is None else content_elements
+        self._refresh_derived()
+    
+    def __repr__(self) -> str:
+        return (f"EnhancedDocumentNode(id={self.id!r}, label={self.label!r}, "
+                f"page={self.page!r}, reading_order={self.reading_order!r})")
+    
+    def _refresh_derived(self):
+        """Recompute the fields derived from label and text (after construction or a merge)."""
+        self.kind, self.nesting_level = parse_label(self.label)
+        self._is_structural = self.kind in STRUCTURAL_KINDS
+        self._is_content = self.kind == LabelKind.CONTENT
+        match = _SECTION_NUMBER_RE.match(self.text)
+        self._section_number = match.group(1) if match else None
     
     def add_child(self, child: 'EnhancedDocumentNode'):
         """Add a child node to this node."""
@@ -82,38 +295,47 @@ class EnhancedDocumentNode:
         elif self.label == 'list':
             self.text = f"{self.text}\n{other.text}"
             self.label = 'list_group'
+        
+        # Label and text may have changed
+        self._refresh_derived()
     
     def get_section_number(self) -> Optional[str]:
         """Extract section number from text if present."""
-        match = re.match(r'^(\d+(?:\.\d+)*)', self.text.strip())
-        return match.group(1) if match else None
+        return self._section_number
     
     def determine_nesting_level(self) -> int:
         """Determine nesting level from label dynamically."""
-        if self.label == 'title':
-            return 0
-        elif self.label == 'sec':
-            return 1
-        elif self.label.startswith('sub_'):
-            # Count the number of 'sub_' prefixes for unlimited depth
-            sub_count = self.label.count('sub_')
-            return sub_count + 1
-        else:
-            return -1  # Content element
+        return self.nesting_level
     
     def is_structural(self) -> bool:
         """Check if this node represents document structure."""
-        return (self.label in ['title', 'sec'] or 
-                self.label.startswith('sub_') or
-                self.label == 'document')
+        return self._is_structural
     
     def is_content(self) -> bool:
         """Check if this node represents content."""
-        return self.label in ['para', 'list', 'list_group', 'figure', 'table', 
-                             'cap', 'fig', 'tab', 'fnote', 'foot', 'author']
+        return self._is_content
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert node to dictionary for JSON serialization."""
+        # Post-order walk on an explicit stack: a node is visited again once its
+        # children's dicts are built, so tree depth is not bound by the recursion limit
+        built: Dict[int, Dict[str, Any]] = {}
+        stack = [(self, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if not expanded:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children)
+                stack.extend((content, False) for content in node.content_elements)
+                continue
+            built[id(node)] = node._shallow_dict(
+                [built.pop(id(child)) for child in node.children],
+                [built.pop(id(content)) for content in node.content_elements]
+            )
+        return built[id(self)]
+    
+    def _shallow_dict(self, children: List[Dict[str, Any]], content_elements: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Dictionary for this node around already-converted children and content elements."""
         result = {
             'id': self.id,
             'label': self.label,
@@ -122,11 +344,11 @@ class EnhancedDocumentNode:
             'page': self.page,
             'reading_order': self.reading_order,
             'bbox': self.bbox,
-            'section_number': self.get_section_number(),
+            'section_number': self._section_number,
             'summary': self.summary,
             'embeddings': self.embeddings,
-            'children': [child.to_dict() for child in self.children],
-            'content_elements': [content.to_dict() for content in self.content_elements]
+            'children': children,
+            'content_elements': content_elements
         }
         
         if self.merged_elements:
@@ -139,36 +361,101 @@ class EnhancedDocumentNode:
 class EnhancedDocumentHierarchyBuilder:
     """Enhanced builder with unlimited depth, element merging, and AI-powered summaries."""
     
-    def __init__(self):
+    def __init__(self, use_batch_api: bool = False, cache: Optional[SummaryCache] = None):
         self.nodes: List[EnhancedDocumentNode] = []
+        # Consulted before every summary request; None disables caching
+        self.cache = cache
+        # Summarize leaves through the OpenAI Batch API (half price, but may take hours)
+        self.use_batch_api = use_batch_api
+        # Set for the duration of an _openai_session
+        self._aclient: Optional[AsyncOpenAI] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
     
-    def generate_leaf_summary(self, node: EnhancedDocumentNode) -> str:
-        """Generate summary for leaf nodes (content elements) using OpenAI."""
-        try:
-            prompt = f"""
+    def leaf_summary_request(self, node: EnhancedDocumentNode) -> Dict[str, Any]:
+        """Chat completion parameters for a leaf summary, shared by the live and Batch API paths."""
+        prompt = f"""
             Summarize the following text content from a document. Be comprehensive but concise, 
             capturing all important details as this will be used for answering questions later. 
             
             Content type: {node.label}
-            Text: {node.text}
+            Text: {cap_prompt_text(node.text)}
             
             Provide a detailed but brief summary:
             """
+        return {
+            "model": SUMMARY_MODEL,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": 300,
+            "temperature": 0.3
+        }
+    
+    def _leaf_cache_key(self, node: EnhancedDocumentNode) -> str:
+        """Cache key of a leaf's summary, whichever path produced it."""
+        request = self.leaf_summary_request(node)
+        return SummaryCache.key(request["model"], request["messages"][-1]["content"])
+    
+    def _cache_leaf_summaries(self, nodes: List[EnhancedDocumentNode]):
+        """Store the summaries of nodes that have one."""
+        if self.cache is not None:
+            self.cache.put_many([(self._leaf_cache_key(node), node.summary) for node in nodes if node.summary])
+    
+    async def agenerate_leaf_summary(self, node: EnhancedDocumentNode) -> str:
+        """Generate summary for leaf nodes (content elements) using OpenAI."""
+        try:
+            request = self.leaf_summary_request(node)
+            key = SummaryCache.key(request["model"], request["messages"][-1]["content"])
+            cached = self.cache.get(key) if self.cache is not None else None
+            if cached is not None:
+                return cached
             
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=300,
-                temperature=0.3
-            )
+            response = await self._arequest(self._aclient.chat.completions.create, **request)
             
             content = response.choices[0].message.content if response.choices and response.choices[0].message else ""
-            return (content or "").strip()
+            summary = (content or "").strip()
+            if summary and self.cache is not None:
+                self.cache.put(key, summary)
+            return summary
         except Exception as e:
             print(f"Warning: Failed to generate summary for {node.id}: {e}")
             return f"Summary unavailable for {node.label}: {node.text[:100]}..."
     
-    def generate_section_summary(self, node: EnhancedDocumentNode) -> str:
+    async def agenerate_leaf_summaries_batch(self, nodes: List[EnhancedDocumentNode]):
+        """Summarize several leaf nodes in a single chat call.
+        
+        The model answers with a JSON object of summaries keyed by position. Nodes
+        missing from the answer keep no summary so the per-leaf pass retries them.
+        """
+        snippets = [{"id": i, "label": node.label, "text": cap_prompt_text(node.text)} for i, node in enumerate(nodes)]
+        prompt = (
+            "Summarize each of the following document snippets. Be comprehensive but concise, "
+            "capturing all important details as the summaries will be used for answering questions later. "
+            'Return JSON: {"summaries": [{"id": <snippet id>, "summary": <summary>}]}.\n'
+            + json.dumps(snippets, ensure_ascii=False)
+        )
+        try:
+            response = await self._arequest(
+                self._aclient.chat.completions.create,
+                model=SUMMARY_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=min(300 * len(nodes), 4096),
+                temperature=0.3,
+                response_format={"type": "json_object"}
+            )
+            content = response.choices[0].message.content if response.choices and response.choices[0].message else ""
+            summaries = json.loads(content or "{}").get("summaries") or []
+        except Exception as e:
+            print(f"Warning: Failed to generate grouped summaries for {len(nodes)} elements: {e}")
+            return
+        
+        for item in summaries:
+            if not isinstance(item, dict):
+                continue
+            i, summary = item.get("id"), item.get("summary")
+            if isinstance(i, int) and 0 <= i < len(nodes) and isinstance(summary, str) and summary.strip():
+                nodes[i].summary = summary.strip()
+        self._cache_leaf_summaries(nodes)
+    
+    async def agenerate_section_summary(self, node: EnhancedDocumentNode) -> str:
         """Generate summary for non-leaf nodes (sections) including children summaries."""
         try:
             # Collect text from node itself
@@ -222,56 +509,305 @@ class EnhancedDocumentHierarchyBuilder:
             ])
             
             prompt = "\n".join(prompt_parts)
+            key = SummaryCache.key(SUMMARY_MODEL, prompt)
+            cached = self.cache.get(key) if self.cache is not None else None
+            if cached is not None:
+                return cached
             
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
+            response = await self._arequest(
+                self._aclient.chat.completions.create,
+                model=SUMMARY_MODEL,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=500,
                 temperature=0.3
             )
             
             content = response.choices[0].message.content if response.choices and response.choices[0].message else ""
-            return (content or "").strip()
+            summary = (content or "").strip()
+            if summary and self.cache is not None:
+                self.cache.put(key, summary)
+            return summary
         except Exception as e:
             print(f"Warning: Failed to generate summary for section {node.id}: {e}")
             return f"Summary unavailable for section {node.label}"
     
-    def generate_summaries_recursive(self, node: EnhancedDocumentNode):
-        """Recursively generate summaries for all nodes in the hierarchy."""
-        print(f"Generating summary for: {node.label} - {node.text[:50]}...")
+    @asynccontextmanager
+    async def _openai_session(self):
+        """Open the shared OpenAI client and request semaphore; nested sessions reuse them."""
+        if self._aclient is not None:
+            yield
+            return
+        # One pooled HTTP client (multiplexed over HTTP/2 when available) for all calls,
+        # so concurrent requests skip per-call TCP and TLS handshakes. _arequest owns
+        # retries, so the SDK's own are turned off.
+        http_client = httpx.AsyncClient(http2=_HTTP2, timeout=60, limits=OPENAI_HTTP_LIMITS)
+        async with http_client, AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client, max_retries=0
+        ) as aclient:
+            self._aclient = aclient
+            self._semaphore = asyncio.Semaphore(SUMMARY_MAX_CONCURRENCY)
+            try:
+                yield
+            finally:
+                self._aclient = None
+                self._semaphore = None
+    
+    async def _arequest(self, create, **params):
+        """Await an OpenAI create call under the semaphore, retrying transient errors.
         
-        # First, generate summaries for all children (bottom-up approach)
-        for child in node.children:
-            self.generate_summaries_recursive(child)
+        Waits honor Retry-After and otherwise back off exponentially with jitter;
+        the slot is released while waiting. The last failure is re-raised.
+        """
+        for attempt in range(1, OPENAI_MAX_ATTEMPTS + 1):
+            try:
+                async with self._semaphore:
+                    return await create(**params)
+            except TRANSIENT_OPENAI_ERRORS as e:
+                if attempt == OPENAI_MAX_ATTEMPTS:
+                    raise
+                delay = _retry_delay(e, attempt)
+                print(f"Warning: OpenAI request failed (attempt {attempt}/{OPENAI_MAX_ATTEMPTS}): {e}; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+    
+    async def agenerate_summaries(self, root: EnhancedDocumentNode):
+        """Generate summaries for the whole hierarchy, overlapping independent API calls."""
+        async with self._openai_session():
+            if self.cache is not None:
+                self._apply_cached_leaf_summaries(root)
+            if self.use_batch_api:
+                await self._asummarize_leaves_with_batch(root)
+            if LEAF_SUMMARY_GROUP_SIZE > 1:
+                await self._asummarize_leaves_grouped(root)
+            await self._agenerate_remaining_summaries(root)
+    
+    async def acompute_embeddings(self, root: EnhancedDocumentNode):
+        """Embed every leaf's text, EMBEDDING_BATCH_SIZE texts per request, then derive sections'.
         
-        # Generate summaries for content elements (leaf nodes)
-        for content in node.content_elements:
-            if not content.summary:
-                content.summary = self.generate_leaf_summary(content)
+        Vectors are looked up in and stored to the cache by sha256(model, text),
+        so unchanged text is never embedded twice. Nodes with children or content
+        elements cost no request: they get the weighted average of those below them.
+        """
+        by_text: Dict[str, List[EnhancedDocumentNode]] = defaultdict(list)
+        inner_nodes = []  # pre-order, so parents come before their children
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node.children or node.content_elements:
+                inner_nodes.append(node)
+            elif node.text.strip():
+                by_text[node.text].append(node)
+            stack.extend(node.children)
+            stack.extend(node.content_elements)
+        if not by_text:
+            return
         
-        # Generate summary for this node if it's structural or has content
-        if (node.is_structural() or node.label == 'document') and not node.summary:
-            node.summary = self.generate_section_summary(node)
+        texts = list(by_text)
+        keys = [SummaryCache.key(EMBEDDING_MODEL, text) for text in texts]
+        vectors = self.cache.get_embeddings(keys) if self.cache is not None else {}
+        missing = [(key, text) for key, text in zip(keys, texts) if key not in vectors]
+        if vectors:
+            print(f"Reused {len(vectors)} cached embeddings.")
+        
+        async def embed_batch(batch: List[Tuple[str, str]]):
+            try:
+                response = await self._arequest(
+                    self._aclient.embeddings.create,
+                    model=EMBEDDING_MODEL,
+                    input=[text for _, text in batch]
+                )
+            except Exception as e:
+                print(f"Warning: Failed to embed {len(batch)} texts: {e}")
+                return
+            # Round-trip through float32 so fresh and cached vectors are identical
+            fresh = [(batch[item.index][0], np.asarray(item.embedding, dtype=np.float32)) for item in response.data]
+            vectors.update(fresh)
+            if self.cache is not None:
+                self.cache.put_embeddings(fresh)
+        
+        async with self._openai_session():
+            await asyncio.gather(*(
+                embed_batch(missing[i:i + EMBEDDING_BATCH_SIZE])
+                for i in range(0, len(missing), EMBEDDING_BATCH_SIZE)
+            ))
+        
+        for key, text in zip(keys, texts):
+            vector = vectors.get(key)
+            if vector is not None:
+                embedding = vector.tolist()
+                for node in by_text[text]:
+                    node.embeddings = embedding
+        
+        self._propagate_section_embeddings(inner_nodes)
+    
+    def _propagate_section_embeddings(self, inner_nodes: List[EnhancedDocumentNode]):
+        """Give each inner node the text-length-weighted mean of its children's embeddings.
+        
+        inner_nodes must be in pre-order; walking it backwards visits every node after
+        all nodes below it. A child section weighs as much as all text under it.
+        """
+        weights: Dict[int, float] = {}
+        for node in reversed(inner_nodes):
+            members = [member for member in (*node.children, *node.content_elements) if member.embeddings]
+            if not members:
+                continue
+            member_weights = np.array([weights.get(id(member), len(member.text)) for member in members], dtype=np.float64)
+            total = float(member_weights.sum())
+            vector = np.average(
+                np.array([member.embeddings for member in members], dtype=np.float32),
+                axis=0,
+                weights=member_weights if total > 0 else None
+            )
+            # Normalize so section vectors are on the same scale as the model's
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                vector = vector / norm
+            node.embeddings = vector.astype(np.float32).tolist()
+            weights[id(node)] = total
+    
+    def _unsummarized_leaves(self, root: EnhancedDocumentNode) -> List[EnhancedDocumentNode]:
+        """Content elements anywhere under root that have no summary yet."""
+        leaves = []
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            leaves.extend(content for content in node.content_elements if not content.summary)
+            stack.extend(node.children)
+        return leaves
+    
+    def _apply_cached_leaf_summaries(self, root: EnhancedDocumentNode):
+        """Fill in leaf summaries already in the cache so no path requests them again."""
+        leaves = self._unsummarized_leaves(root)
+        keys = [self._leaf_cache_key(leaf) for leaf in leaves]
+        found = self.cache.get_many(keys)
+        for leaf, key in zip(leaves, keys):
+            if key in found:
+                leaf.summary = found[key]
+        if found:
+            print(f"Reused {len(found)} cached leaf summaries.")
+    
+    def _distinct_leaves(self, leaves: List[EnhancedDocumentNode]) -> Tuple[
+            List[EnhancedDocumentNode], List[Tuple[EnhancedDocumentNode, EnhancedDocumentNode]]]:
+        """Split leaves into one per distinct prompt and (duplicate, representative) pairs.
+        
+        Repeated boilerplate such as running headers is then summarized only once.
+        """
+        representative_by_key: Dict[str, EnhancedDocumentNode] = {}
+        distinct, duplicates = [], []
+        for leaf in leaves:
+            representative = representative_by_key.setdefault(self._leaf_cache_key(leaf), leaf)
+            if representative is leaf:
+                distinct.append(leaf)
+            else:
+                duplicates.append((leaf, representative))
+        return distinct, duplicates
+    
+    @staticmethod
+    def _share_duplicate_summaries(duplicates: List[Tuple[EnhancedDocumentNode, EnhancedDocumentNode]]):
+        """Give each duplicate leaf its representative's summary, if it got one."""
+        for leaf, representative in duplicates:
+            if representative.summary:
+                leaf.summary = representative.summary
+    
+    async def _asummarize_leaves_grouped(self, root: EnhancedDocumentNode):
+        """Summarize leaves from across the whole tree in groups of LEAF_SUMMARY_GROUP_SIZE."""
+        leaves, duplicates = self._distinct_leaves(self._unsummarized_leaves(root))
+        await asyncio.gather(*(
+            self.agenerate_leaf_summaries_batch(leaves[i:i + LEAF_SUMMARY_GROUP_SIZE])
+            for i in range(0, len(leaves), LEAF_SUMMARY_GROUP_SIZE)
+        ))
+        self._share_duplicate_summaries(duplicates)
+    
+    async def _asummarize_leaves_with_batch(self, root: EnhancedDocumentNode):
+        """Summarize every leaf in one Batch API job.
+        
+        Leaves the job does not answer keep no summary and are picked up by the
+        live pass afterwards, as are all section summaries (they need their children's).
+        """
+        leaves, duplicates = self._distinct_leaves(self._unsummarized_leaves(root))
+        if not leaves:
+            return
+        
+        # custom_id is the leaf's position: node ids are not guaranteed unique
+        lines = [
+            json.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self.leaf_summary_request(leaf)
+            }, ensure_ascii=False)
+            for i, leaf in enumerate(leaves)
+        ]
+        try:
+            input_file = await self._aclient.files.create(
+                file=("leaf_summaries.jsonl", "\n".join(lines).encode("utf-8")),
+                purpose="batch"
+            )
+            batch = await self._aclient.batches.create(
+                input_file_id=input_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h"
+            )
+            print(f"Submitted {len(leaves)} leaf summaries as batch {batch.id}; waiting for it to finish...")
+            while batch.status not in BATCH_TERMINAL_STATUSES:
+                await asyncio.sleep(BATCH_POLL_INTERVAL)
+                batch = await self._aclient.batches.retrieve(batch.id)
+            if batch.status != "completed" or not batch.output_file_id:
+                print(f"Warning: Batch {batch.id} ended as {batch.status}; summarizing leaves directly.")
+                return
+            output = await self._aclient.files.content(batch.output_file_id)
+        except Exception as e:
+            print(f"Warning: Batch API summaries failed, summarizing leaves directly: {e}")
+            return
+        
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if response.get("status_code") != 200:
+                continue
+            choices = response.get("body", {}).get("choices") or []
+            content = choices[0].get("message", {}).get("content") if choices else None
+            if content:
+                leaves[int(result["custom_id"])].summary = content.strip()
+        self._cache_leaf_summaries(leaves)
+        self._share_duplicate_summaries(duplicates)
+    
+    async def _agenerate_remaining_summaries(self, root: EnhancedDocumentNode):
+        """Generate every summary still missing in the hierarchy, bottom-up."""
+        # Content elements (leaf nodes) are independent, so all of them are summarized at once
+        pending, duplicates = self._distinct_leaves(self._unsummarized_leaves(root))
+        results = await asyncio.gather(*(self.agenerate_leaf_summary(content) for content in pending))
+        for content, summary in zip(pending, results):
+            content.summary = summary
+        self._share_duplicate_summaries(duplicates)
+        
+        # Group sections by depth without recursion, then summarize the deepest level first:
+        # each level runs concurrently once every subsection below it has its summary
+        levels = []
+        frontier = [root]
+        while frontier:
+            levels.append(frontier)
+            frontier = [child for node in frontier for child in node.children]
+        for level in reversed(levels):
+            sections = [node for node in level
+                        if (node.is_structural() or node.label == 'document') and not node.summary]
+            for node in sections:
+                print(f"Generating summary for: {node.label} - {node.text[:50]}...")
+            results = await asyncio.gather(*(self.agenerate_section_summary(node) for node in sections))
+            for node, summary in zip(sections, results):
+                node.summary = summary
         
     def determine_node_level_dynamic(self, element: Dict[str, Any]) -> int:
         """Dynamically determine hierarchical level for unlimited depth."""
-        label = element.get('label', '')
-        text = element.get('text', '').strip()
-        
-        if label == 'title':
-            return 0
-        elif label == 'sec':
-            return 1
-        elif label.startswith('sub_'):
-            # Handle unlimited depth: sub_sec=2, sub_sub_sec=3, sub_sub_sub_sec=4, etc.
-            sub_count = label.count('sub_')
-            return sub_count + 1
-        else:
-            return -1  # Content elements
+        # sub_sec=2, sub_sub_sec=3, sub_sub_sub_sec=4, etc.; content elements are -1
+        return parse_label(element.get('label', ''))[1]
     
     def create_node_from_element(self, element: Dict[str, Any], page_num: int) -> EnhancedDocumentNode:
         """Create an EnhancedDocumentNode from a JSON element."""
-        node_id = f"page_{page_num}_order_{element.get('reading_order', 0)}"
+        # Interned: every copy of an id (cache keys, lookups) then shares one string,
+        # and equality checks between them short-circuit on identity
+        node_id = sys.intern(f"page_{page_num}_order_{element.get('reading_order', 0)}")
         level = self.determine_node_level_dynamic(element)
         
         return EnhancedDocumentNode(
@@ -286,58 +822,59 @@ class EnhancedDocumentHierarchyBuilder:
     
     def merge_figure_caption_pairs(self, elements: List[EnhancedDocumentNode]) -> List[EnhancedDocumentNode]:
         """Merge fig+cap and tab+cap pairs into single nodes."""
-        merged_elements = []
-        i = 0
+        if len(elements) < 2:
+            return list(elements)
         
-        while i < len(elements):
-            current = elements[i]
-            
-            # Check if current is fig/tab and next is cap
-            if (i + 1 < len(elements) and 
-                current.label in ['fig', 'tab'] and 
-                elements[i + 1].label == 'cap' and
-                current.page == elements[i + 1].page):
-                
-                # Merge fig/tab with caption
-                current.merge_with(elements[i + 1])
-                merged_elements.append(current)
-                i += 2  # Skip both elements
-            else:
-                merged_elements.append(current)
-                i += 1
+        # Find every pair start in one vectorized sweep; Python only touches the merges.
+        # A pair's second element is a caption, so pairs can never overlap.
+        labels = np.array([element.label for element in elements])
+        pages = np.array([element.page for element in elements])
+        pair_starts = np.flatnonzero(
+            np.isin(labels[:-1], ('fig', 'tab')) & (labels[1:] == 'cap') & (pages[:-1] == pages[1:])
+        )
         
-        return merged_elements
+        keep = np.ones(len(elements), dtype=bool)
+        for i in pair_starts:
+            # Merge fig/tab with caption
+            elements[i].merge_with(elements[i + 1])
+        keep[pair_starts + 1] = False  # Drop the captions
+        
+        return [elements[i] for i in np.flatnonzero(keep)]
     
     def merge_consecutive_lists(self, elements: List[EnhancedDocumentNode]) -> List[EnhancedDocumentNode]:
         """Merge consecutive list elements into single nodes."""
-        merged_elements = []
-        i = 0
+        if len(elements) < 2:
+            return list(elements)
         
-        while i < len(elements):
-            current = elements[i]
-            
-            if current.label == 'list':
-                # Start a list group
-                list_group = current
-                j = i + 1
-                
-                # Find consecutive lists on same page
-                while (j < len(elements) and 
-                       elements[j].label == 'list' and
-                       elements[j].page == current.page and
-                       elements[j].reading_order == elements[j-1].reading_order + 1):
-                    list_group.merge_with(elements[j])
-                    j += 1
-                
-                merged_elements.append(list_group)
-                i = j
-            else:
-                merged_elements.append(current)
-                i += 1
+        # joins_previous[k]: element k is a list continuing the list at k - 1
+        # (same page, next reading order), found in one vectorized sweep
+        is_list = np.array([element.label for element in elements]) == 'list'
+        pages = np.array([element.page for element in elements])
+        orders = np.array([element.reading_order for element in elements])
+        joins_previous = np.zeros(len(elements), dtype=bool)
+        joins_previous[1:] = is_list[1:] & is_list[:-1] & (pages[1:] == pages[:-1]) & (orders[1:] == orders[:-1] + 1)
+        
+        # Every element that does not continue a list heads a group (usually of one)
+        group_starts = np.flatnonzero(~joins_previous)
+        group_ends = np.append(group_starts[1:], len(elements))
+        merged_elements = []
+        for start, end in zip(group_starts, group_ends):
+            list_group = elements[start]
+            for j in range(start + 1, end):
+                list_group.merge_with(elements[j])
+            merged_elements.append(list_group)
         
         return merged_elements
     
-    def build_enhanced_hierarchy(self, json_data: Dict[str, Any], enable_summaries: bool = True) -> EnhancedDocumentNode:
+    def build_enhanced_hierarchy(self, json_data: Dict[str, Any], enable_summaries: bool = True,
+                                 enable_embeddings: bool = False) -> EnhancedDocumentNode:
+        """Build the complete enhanced document hierarchy (blocking wrapper)."""
+        return asyncio.run(self.abuild_enhanced_hierarchy(
+            json_data, enable_summaries=enable_summaries, enable_embeddings=enable_embeddings
+        ))
+    
+    async def abuild_enhanced_hierarchy(self, json_data: Dict[str, Any], enable_summaries: bool = True,
+                                        enable_embeddings: bool = False) -> EnhancedDocumentNode:
         """Build the complete enhanced document hierarchy."""
         # Create all nodes first
         all_elements = []
@@ -384,12 +921,20 @@ class EnhancedDocumentHierarchyBuilder:
         print("Assigning content as leaf nodes...")
         self._assign_content_as_leaf_nodes(root, content_nodes)
         
-        # Generate summaries for the entire hierarchy
+        # Generate summaries and embeddings for the entire hierarchy; they are
+        # independent, so both share one client and run concurrently
+        tasks = []
         if enable_summaries:
             print("Generating AI summaries for all nodes...")
-            self.generate_summaries_recursive(root)
+            tasks.append(self.agenerate_summaries(root))
         else:
             print("Skipping AI summaries (disabled).")
+        if enable_embeddings:
+            print("Computing embeddings for all nodes...")
+            tasks.append(self.acompute_embeddings(root))
+        if tasks:
+            async with self._openai_session():
+                await asyncio.gather(*tasks)
         
         return root
     
@@ -431,25 +976,34 @@ class EnhancedDocumentHierarchyBuilder:
         self._collect_structural_nodes(root, all_structural)
         all_structural.sort(key=lambda x: (x.page, x.reading_order))
         
-        for content_node in content_nodes:
-            # Find the most recent structural node before this content
-            best_parent = root
-            for structural_node in all_structural:
-                if (structural_node.page < content_node.page or 
-                    (structural_node.page == content_node.page and 
-                     structural_node.reading_order < content_node.reading_order)):
-                    best_parent = structural_node
-                else:
-                    break
-            
+        content_nodes = sorted(content_nodes, key=lambda x: (x.page, x.reading_order))
+        if not content_nodes:
+            return
+        
+        # Flatten (page, reading_order) into one number per node, as parallel arrays;
+        # scaling pages by the span of reading orders keeps the ordering lexicographic
+        positioned = all_structural + content_nodes
+        pages = np.array([node.page for node in positioned])
+        orders = np.array([node.reading_order for node in positioned])
+        keys = pages * (orders.max() - orders.min() + 1) + (orders - orders.min())
+        structural_keys, content_keys = keys[:len(all_structural)], keys[len(all_structural):]
+        
+        # One vectorized binary search finds, for every content element, the most recent
+        # structural node strictly before it (-1: none, so it belongs to the root)
+        parent_indices = np.searchsorted(structural_keys, content_keys, side='left') - 1
+        for content_node, i in zip(content_nodes, parent_indices.tolist()):
+            best_parent = all_structural[i] if i >= 0 else root
             best_parent.add_content(content_node)
     
     def _collect_structural_nodes(self, node: EnhancedDocumentNode, collection: List[EnhancedDocumentNode]):
-        """Recursively collect all structural nodes."""
-        if node.is_structural() or node.label == 'document':
-            collection.append(node)
-        for child in node.children:
-            self._collect_structural_nodes(child, collection)
+        """Collect all structural nodes in pre-order."""
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current.is_structural() or current.label == 'document':
+                collection.append(current)
+            # Reversed so the first child is visited first, as in a recursive walk
+            stack.extend(reversed(current.children))
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -465,6 +1019,18 @@ def parse_arguments() -> argparse.Namespace:
         help="Skip AI summary generation using OpenAI API"
     )
     
+    parser.add_argument(
+        "--batch-api",
+        action="store_true",
+        help="Summarize leaf elements through the OpenAI Batch API (50%% cheaper, can take up to 24h)"
+    )
+    
+    parser.add_argument(
+        "--embeddings",
+        action="store_true",
+        help="Compute text embeddings for every node using OpenAI API"
+    )
+    
     parser.add_argument(
         "--json-file",
         type=str,
@@ -474,11 +1040,51 @@ def parse_arguments() -> argparse.Namespace:
     return parser.parse_args()
 
 
+def iter_hierarchy_json(root: EnhancedDocumentNode) -> Iterator[str]:
+    """Yield the hierarchy as JSON text without building it as one dictionary first.
+    
+    The output is identical to json.dump(root.to_dict(), f, indent=2, ensure_ascii=False).
+    """
+    # Explicit stack of pending text pieces and (node, depth) entries still to expand
+    stack: List[Union[str, Tuple[EnhancedDocumentNode, int]]] = [(root, 0)]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            yield item
+            continue
+        
+        node, depth = item
+        pad = "\n" + "  " * (depth + 1)
+        item_pad = pad + "  "
+        tokens: List[Union[str, Tuple[EnhancedDocumentNode, int]]] = ["{"]
+        # Same keys in the same order as to_dict
+        for i, (key, value) in enumerate(node._shallow_dict([], []).items()):
+            if i:
+                tokens.append(",")
+            if key in ('children', 'content_elements'):
+                nodes = node.children if key == 'children' else node.content_elements
+                if not nodes:
+                    tokens.append(f'{pad}"{key}": []')
+                    continue
+                tokens.append(f'{pad}"{key}": [')
+                for j, sub_node in enumerate(nodes):
+                    tokens.append(f",{item_pad}" if j else item_pad)
+                    tokens.append((sub_node, depth + 2))
+                tokens.append(f"{pad}]")
+            else:
+                value_text = json.dumps(value, indent=2, ensure_ascii=False).replace("\n", pad)
+                tokens.append(f'{pad}"{key}": {value_text}')
+        tokens.append("\n" + "  " * depth + "}")
+        stack.extend(reversed(tokens))
+
+
 def visualize_enhanced_hierarchy(node: EnhancedDocumentNode, indent: int = 0, max_text_length: int = 80) -> str:
     """Create a text visualization of the enhanced document hierarchy."""
-    result = []
-    indent_str = "  " * indent
-    
+    return "\n".join(iter_visualize(node, indent, max_text_length))
+
+
+def iter_visualize(node: EnhancedDocumentNode, indent: int = 0, max_text_length: int = 80) -> Iterator[str]:
+    """Yield the lines of the hierarchy visualization one at a time."""
     # Enhanced icon mapping
     icon_map = {
         'title': '📖',
@@ -501,37 +1107,42 @@ def visualize_enhanced_hierarchy(node: EnhancedDocumentNode, indent: int = 0, ma
         'author': '👤'
     }
     
-    # Determine icon
-    if node.label.startswith('sub_'):
-        # Dynamic icons for unlimited sub levels
-        sub_count = node.label.count('sub_')
-        icons = ['📝', '•', '◦', '‣', '▪', '▫', '‣', '◊']
-        icon = icons[min(sub_count - 1, len(icons) - 1)]
-    else:
-        icon = icon_map.get(node.label, '?')
-    
-    text = node.text[:max_text_length] + ('...' if len(node.text) > max_text_length else '')
-    
-    if node.is_structural() or node.label == 'document':
-        # Show structural node
-        merge_info = f" [MERGED: {len(node.merged_elements)} elements]" if node.merged_elements else ""
-        result.append(f"{indent_str}{icon} [{node.label}] {text} (Page {node.page}){merge_info}")
-        
-        # Show children (structural elements)
-        for child in node.children:
-            result.append(visualize_enhanced_hierarchy(child, indent + 1, max_text_length))
+    # Explicit stack instead of recursion; each node is pushed again (expanded=True)
+    # so its content elements are listed after all of its child sections
+    stack = [(node, indent, False)]
+    while stack:
+        current, depth, expanded = stack.pop()
+        if not (current.is_structural() or current.label == 'document'):
+            continue
         
-        # Show content elements (leaf nodes)
-        if node.content_elements:
-            content_indent = indent + 1
-            content_indent_str = "  " * content_indent
-            for content in node.content_elements:
+        if expanded:
+            # Show content elements (leaf nodes)
+            content_indent_str = "  " * (depth + 1)
+            for content in current.content_elements:
                 content_icon = icon_map.get(content.label, '?')
                 content_text = content.text[:50] + ('...' if len(content.text) > 50 else '')
                 merge_info = f" [MERGED: {len(content.merged_elements)}]" if content.merged_elements else ""
-                result.append(f"{content_indent_str}  {content_icon} {content_text}{merge_info}")
-    
-    return "\n".join(result)
+                yield f"{content_indent_str}  {content_icon} {content_text}{merge_info}"
+            continue
+        
+        # Determine icon
+        if current.kind == LabelKind.SUBSECTION:
+            # Dynamic icons for unlimited sub levels
+            sub_count = current.nesting_level - 1
+            icons = ['📝', '•', '◦', '‣', '▪', '▫', '‣', '◊']
+            icon = icons[min(sub_count - 1, len(icons) - 1)]
+        else:
+            icon = icon_map.get(current.label, '?')
+        
+        text = current.text[:max_text_length] + ('...' if len(current.text) > max_text_length else '')
+        
+        # Show structural node
+        merge_info = f" [MERGED: {len(current.merged_elements)} elements]" if current.merged_elements else ""
+        yield f"{'  ' * depth}{icon} [{current.label}] {text} (Page {current.page}){merge_info}"
+        
+        # Show children (structural elements) before the content elements
+        stack.append((current, depth, True))
+        stack.extend((child, depth + 1, False) for child in reversed(current.children))
 
 
 def main():
@@ -588,9 +1199,20 @@ def main():
         print("Building enhanced document hierarchy with unlimited depth and AI summaries...")
     else:
         print("Building enhanced document hierarchy with unlimited depth (summaries disabled)...")
-    builder = EnhancedDocumentHierarchyBuilder()
+    embeddings_enabled = args.embeddings and bool(os.getenv("OPENAI_API_KEY"))
+    if args.embeddings and not embeddings_enabled:
+        print("⚠️ Warning: OPENAI_API_KEY not found! Embeddings will be skipped.")
+    
+    cache = SummaryCache() if (summaries_enabled or embeddings_enabled) and SUMMARY_CACHE_PATH else None
+    builder = EnhancedDocumentHierarchyBuilder(use_batch_api=args.batch_api, cache=cache)
     # Build hierarchy
-    document_root = builder.build_enhanced_hierarchy(data, enable_summaries=summaries_enabled)
+    try:
+        document_root = asyncio.run(builder.abuild_enhanced_hierarchy(
+            data, enable_summaries=summaries_enabled, enable_embeddings=embeddings_enabled
+        ))
+    finally:
+        if cache is not None:
+            cache.close()
     
     print("\n" + "=" * 80)
     if summaries_enabled:
@@ -598,20 +1220,19 @@ def main():
     else:
         print("ENHANCED DOCUMENT HIERARCHY (Unlimited Depth + Merged Elements)")
     print("=" * 80)
-    print(visualize_enhanced_hierarchy(document_root))
+    # Written line by line; the whole visualization is never held in memory
+    sys.stdout.writelines(f"{line}\n" for line in iter_visualize(document_root))
     
-    # Save enhanced hierarchy to JSON
+    # Save enhanced hierarchy to JSON while the statistics are gathered
     hierarchy_output = "enhanced_document_hierarchy.json"
-    with open(hierarchy_output, 'w', encoding='utf-8') as f:
-        json.dump(document_root.to_dict(), f, indent=2, ensure_ascii=False)
+    stats = asyncio.run(save_hierarchy_with_stats(hierarchy_output, document_root))
     
     if summaries_enabled:
         print(f"\n💾 Enhanced document hierarchy with summaries saved to: {hierarchy_output}")
     else:
         print(f"\n💾 Enhanced document hierarchy (no summaries) saved to: {hierarchy_output}")
     
-    # Generate enhanced statistics
-    stats = generate_enhanced_hierarchy_stats(document_root)
+    # Enhanced statistics
     print(f"\n📊 Enhanced Hierarchy Statistics:")
     print(f"   Total structural nodes: {stats['structural_nodes']}")
     print(f"   Total content elements (leaf nodes): {stats['content_elements']}")
@@ -623,6 +1244,23 @@ def main():
     print(f"   Sections with content: {stats['sections_with_content']}")
 
 
+def write_hierarchy_json(path: str, root: EnhancedDocumentNode):
+    """Write the hierarchy to path as indented JSON."""
+    # Streamed straight from the tree through a large buffer; no intermediate dict
+    with open(path, 'w', encoding='utf-8', buffering=1 << 20) as f:
+        f.writelines(iter_hierarchy_json(root))
+
+
+async def save_hierarchy_with_stats(path: str, root: EnhancedDocumentNode) -> Dict[str, int]:
+    """Write the hierarchy JSON and compute its statistics concurrently."""
+    # Neither mutates the tree; the file write waits on disk while the stats walk runs
+    _, stats = await asyncio.gather(
+        asyncio.to_thread(write_hierarchy_json, path, root),
+        asyncio.to_thread(generate_enhanced_hierarchy_stats, root)
+    )
+    return stats
+
+
 def generate_enhanced_hierarchy_stats(root: EnhancedDocumentNode) -> Dict[str, int]:
     """Generate statistics about the enhanced document hierarchy."""
     stats = {
@@ -636,7 +1274,10 @@ def generate_enhanced_hierarchy_stats(root: EnhancedDocumentNode) -> Dict[str, i
         'sections_with_content': 0
     }
     
-    def count_nodes(node: EnhancedDocumentNode, depth: int = 0):
+    # Explicit stack of (node, depth) instead of recursion
+    stack = [(root, 0)]
+    while stack:
+        node, depth = stack.pop()
         stats['max_depth'] = max(stats['max_depth'], depth)
         
         if node.summary:
@@ -659,10 +1300,8 @@ def generate_enhanced_hierarchy_stats(root: EnhancedDocumentNode) -> Dict[str, i
             elif content.label == 'list_group':
                 stats['merged_lists'] += 1
         
-        for child in node.children:
-            count_nodes(child, depth + 1)
+        stack.extend((child, depth + 1) for child in node.children)
     
-    count_nodes(root)
     return stats
 
 